@@ -4,7 +4,9 @@
 import os
 import re
 import sys
+import time
 import uuid
+import functools
 import traceback
 import subprocess
 import xml.etree.ElementTree
@@ -21,6 +23,7 @@ import sublime_plugin
 import WoTScriptTerminal.sublime.views
 import WoTScriptTerminal.sublime.settings
 import WoTScriptTerminal.terminal.terminal
+import WoTScriptTerminal.terminal.profiler
 
 # *************************
 # Globals
@@ -35,15 +38,22 @@ def plugin_loaded():
 	terminal = ScriptTerminal(TerminalSettings('WoTScriptTerminal.sublime-settings'))
 	terminal.log_buffer_enable()
 	terminal.views_update_enable()
+	terminal.profile_views_enable()
+	terminal.samples_views_enable()
+	terminal.stats_views_enable()
 	return
 
 def plugin_unloaded():
 	global terminal
-	terminal.settings.save()
 	if terminal.is_connected():
 		terminal.disconnect()
+	terminal.log_cursor_save()
+	terminal.stats_views_disable()
+	terminal.samples_views_disable()
+	terminal.profile_views_disable()
 	terminal.views_update_disable()
 	terminal.log_buffer_disable()
+	terminal.buffered_logs_close()
 	terminal = None
 	return
 
@@ -57,7 +67,24 @@ class TerminalSettings(WoTScriptTerminal.sublime.settings.Settings):
 		'save_locals': True,
 		'fetch_logs': True,
 		'show_output': True,
+		'log_flush_delay': 0.005,
+		'log_flush_size': 65536,
+		'view_update_interval': 50,
+		'view_max_lines': 20000,
+		'view_max_chars': 4194304,
+		'log_buffer_size': 1048576,
+		'log_page_size': 262144,
+		'log_segment_size': 4194304,
+		'log_segment_count': 64,
+		'script_hashing': True,
+		'log_compression': 0,
+		'log_subscription': None,
+		'profile_top': 25,
+		'profile_save_path': '',
+		'sampling_interval': 0.005,
+		'sampling_chunk_size': 262144,
 		'client_uuid': str(uuid.uuid4()),
+		'log_cursor': None,
 		'game_path': 'C:\\Program Files\\World of Tanks\\',
 		'replay_regex': '^.+\\.wotreplay$',
 		'replay_paths': [
@@ -99,6 +126,19 @@ class ScriptTerminal(WoTScriptTerminal.sublime.views.ViewController, WoTScriptTe
 		self.process = None
 		self.settings = settings
 		self.uuid = self.settings.setdefault('client_uuid')
+		self.log_cursor = tuple(self.settings['log_cursor']) if self.settings['log_cursor'] else None
+		self.update_interval = self.settings['view_update_interval']
+		self.script_hashing = self.settings['script_hashing']
+		self.view_max_lines = self.settings['view_max_lines']
+		self.view_max_chars = self.settings['view_max_chars']
+		self.log_buffer.tail_limit = self.settings['log_buffer_size']
+		self.log_buffer.segment_size = self.settings['log_segment_size']
+		self.log_buffer.segment_count = self.settings['log_segment_count']
+		self.settings.save()
+		return
+
+	def log_cursor_save(self):
+		self.settings['log_cursor'] = self.log_cursor_get()
 		self.settings.save()
 		return
 
@@ -149,6 +189,80 @@ class ScriptTerminal(WoTScriptTerminal.sublime.views.ViewController, WoTScriptTe
 	def views_update_disable(self):
 		return self.unregister_event(self.log_update_views)
 
+	def profile_show(self, result):
+		sublime.set_timeout(functools.partial(self.profile_view, result), 0)
+		return
+
+	def profile_view(self, result):
+		view = self.create_file_view(sublime.active_window(), 'WoT Profile: {0}'.format(result[0].split('|')[-1]), True, False)
+		view.run_command('append', {'characters': WoTScriptTerminal.terminal.profiler.profile_format(result)})
+		view.set_read_only(True)
+		if self.settings['profile_save_path'] and result[7] is not None:
+			name = re.sub(r'[^\w.-]+', '_', result[0].split('|')[-1])
+			path = self.join_path(self.settings['profile_save_path'], '{0}-{1}.pstats'.format(name, time.strftime('%Y%m%d-%H%M%S')))
+			try:
+				WoTScriptTerminal.terminal.profiler.profile_dump(result, path)
+				sublime.status_message('Profile stats saved: {0}'.format(path))
+			except:
+				sys.stderr.write('-' * 40 + '\n')
+				sys.stderr.write(traceback.format_exc())
+				sys.stderr.write('-' * 40 + '\n')
+		return
+
+	def profile_views_enable(self):
+		self.profile_event += self.profile_show
+		return
+
+	def profile_views_disable(self):
+		self.profile_event -= self.profile_show
+		return
+
+	def samples_show(self, string):
+		sublime.set_timeout(functools.partial(self.samples_view, string), 0)
+		return
+
+	def samples_view(self, string):
+		view = self.create_file_view(sublime.active_window(), 'WoT Samples', True, False)
+		view.run_command('append', {'characters': string})
+		view.set_read_only(True)
+		if self.settings['profile_save_path'] and string:
+			path = self.join_path(self.settings['profile_save_path'], 'samples-{0}.collapsed'.format(time.strftime('%Y%m%d-%H%M%S')))
+			try:
+				with open(path, 'w', encoding='utf-8') as fobj:
+					fobj.write(string)
+				sublime.status_message('Collapsed stacks saved: {0}'.format(path))
+			except:
+				sys.stderr.write('-' * 40 + '\n')
+				sys.stderr.write(traceback.format_exc())
+				sys.stderr.write('-' * 40 + '\n')
+		return
+
+	def stats_show(self, string):
+		sublime.set_timeout(functools.partial(self.stats_view, string), 0)
+		return
+
+	def stats_view(self, string):
+		view = self.create_file_view(sublime.active_window(), 'WoT Terminal Stats', True, False)
+		view.run_command('append', {'characters': string + '\n'})
+		view.set_read_only(True)
+		return
+
+	def stats_views_enable(self):
+		self.stats_event += self.stats_show
+		return
+
+	def stats_views_disable(self):
+		self.stats_event -= self.stats_show
+		return
+
+	def samples_views_enable(self):
+		self.samples_event += self.samples_show
+		return
+
+	def samples_views_disable(self):
+		self.samples_event -= self.samples_show
+		return
+
 # *************************
 # Sublime Event Listeners
 # *************************
@@ -219,10 +333,16 @@ class ScriptTerminalConnectCommand(sublime_plugin.ApplicationCommand):
 		result = terminal.connect(server_address)
 		message = 'Connected to WoT client.' if result else 'Connect to WoT client failed.'
 		sublime.status_message(message)
-		if result and terminal.settings['fetch_logs']:
-			terminal.fetch_logs()
+		if result:
+			terminal.log_coalescing(terminal.settings['log_flush_delay'], terminal.settings['log_flush_size'])
+		if result and terminal.settings['log_compression']:
+			terminal.log_compression(terminal.settings['log_compression'])
+		if result and terminal.settings['log_subscription']:
+			terminal.log_subscribe(**terminal.settings['log_subscription'])
 		if result and terminal.settings['save_locals']:
 			terminal.save_locals()
+		if result and terminal.settings['fetch_logs']:
+			terminal.fetch_logs()
 		return
 
 	def is_enabled(self):
@@ -233,6 +353,7 @@ class ScriptTerminalDisconnectCommand(sublime_plugin.ApplicationCommand):
 	def run(self):
 		global terminal
 		terminal.disconnect()
+		terminal.log_cursor_save()
 		message = 'Disconnected from WoT client.'
 		sublime.status_message(message)
 		return
@@ -257,6 +378,77 @@ class ScriptTerminalExecuteScriptCommand(sublime_plugin.TextCommand):
 		global terminal
 		return terminal is not None and terminal.is_connected()
 
+class ScriptTerminalProfileScriptCommand(sublime_plugin.TextCommand):
+	def run(self, edit):
+		global terminal
+		filename = os.path.basename(self.view.file_name() or self.view.name()) or '<untitled>'
+		script = self.view.substr(sublime.Region(0, self.view.size()))
+		if not script:
+			return
+		result = terminal.profile_script(filename, script, terminal.settings['profile_top'], bool(terminal.settings['profile_save_path']))
+		message = 'Script sending to WoT client for profiling successful.' if result else 'Script sending to WoT client for profiling failed.'
+		sublime.status_message(message)
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and terminal.is_connected()
+
+class ScriptTerminalShowStatsCommand(sublime_plugin.ApplicationCommand):
+	def run(self):
+		global terminal
+		result = terminal.stats_report()
+		sublime.status_message('Requesting WoT terminal stats.' if result else 'WoT terminal stats request failed.')
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and terminal.is_connected()
+
+class ScriptTerminalSamplingStartCommand(sublime_plugin.ApplicationCommand):
+	def run(self):
+		global terminal
+		result = terminal.sampling_start(terminal.settings['sampling_interval'])
+		sublime.status_message('Sampling profiler started.' if result else 'Sampling profiler start failed.')
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and terminal.is_connected()
+
+class ScriptTerminalSamplingStopCommand(sublime_plugin.ApplicationCommand):
+	def run(self):
+		global terminal
+		result = terminal.sampling_stop()
+		sublime.status_message('Sampling profiler stopped.' if result else 'Sampling profiler stop failed.')
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and terminal.is_connected()
+
+class ScriptTerminalSamplingFetchCommand(sublime_plugin.ApplicationCommand):
+	def run(self):
+		global terminal
+		result = terminal.sampling_fetch(terminal.settings['sampling_chunk_size'])
+		sublime.status_message('Fetching sampling profile.' if result else 'Sampling profile fetch failed.')
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and terminal.is_connected()
+
+class ScriptTerminalSamplingClearCommand(sublime_plugin.ApplicationCommand):
+	def run(self):
+		global terminal
+		result = terminal.sampling_clear()
+		sublime.status_message('Sampling profile cleared.' if result else 'Sampling profile clear failed.')
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and terminal.is_connected()
+
 class ScriptTerminalExecuteSelectedCommand(sublime_plugin.TextCommand):
 	def run(self, edit):
 		global terminal
@@ -283,6 +475,16 @@ class ScriptTerminalUpdateLogViewCommand(sublime_plugin.TextCommand):
 		global terminal
 		return terminal is not None and self.view.id() in terminal.views
 
+class ScriptTerminalPrependLogViewCommand(sublime_plugin.TextCommand):
+	def run(self, edit, string):
+		global terminal
+		terminal.view_prepend_string(self.view, edit, string)
+		return
+
+	def is_enabled(self):
+		global terminal
+		return terminal is not None and self.view.id() in terminal.views
+
 class ScriptTerminalClearLogViewCommand(sublime_plugin.TextCommand):
 	def run(self, edit):
 		global terminal
@@ -297,13 +499,31 @@ class ScriptTerminalNewLogFileCommand(sublime_plugin.WindowCommand):
 	def run(self):
 		global terminal
 		view = terminal.create_file(self.window, 'WoT Python Log', True, True)
-		view.run_command('script_terminal_update_log_view', {'string': terminal.buffered_logs_get()})
+		offset, string = terminal.buffered_logs_recent()
+		view.run_command('script_terminal_update_log_view', {'string': string})
+		view.settings().set(terminal.view_history_key, offset)
 		return
 
 	def is_enabled(self):
 		global terminal
 		return terminal is not None
 
+class ScriptTerminalLoadOlderLogsCommand(sublime_plugin.WindowCommand):
+	def run(self):
+		global terminal
+		view = self.window.active_view()
+		offset, string = terminal.buffered_logs_older(view.settings().get(terminal.view_history_key), terminal.settings['log_page_size'])
+		if string:
+			view.run_command('script_terminal_prepend_log_view', {'string': string})
+		view.settings().set(terminal.view_history_key, offset)
+		sublime.status_message('Older WoT logs loaded.' if string else 'No older WoT logs available.')
+		return
+
+	def is_enabled(self):
+		global terminal
+		view = self.window.active_view()
+		return terminal is not None and view is not None and view.id() in terminal.views and view.settings().get(terminal.view_history_key) is not None
+
 class ScriptTerminalEmptyLogFileCommand(sublime_plugin.WindowCommand):
 	def run(self):
 		global terminal
@@ -328,7 +548,7 @@ class ScriptTerminalShowLogOutputCommand(sublime_plugin.WindowCommand):
 	def run(self):
 		global terminal
 		view = terminal.create_output(self.window, 'wot_python_log', True)
-		self.window.run_command('show_panel', {'panel': 'output.' + 'wot_python_log'})
+		terminal.show_output(self.window, 'wot_python_log')
 		return
 
 	def is_enabled(self):
@@ -0,0 +1,279 @@
+import os
+import gc
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+
+from terminal.client import TerminalClient
+from terminal.scheduler import TickLoop
+from terminal.server import TerminalHandler, TerminalController
+from terminal.protocol import LOG_LEVELS
+from terminal.sockets import TCPStreamIO, TCPFrameIO
+
+clock = getattr(time, 'perf_counter', time.time)
+
+class NullStream(object):
+	encoding = 'utf-8'
+
+	def write(self, string):
+		return
+
+	def flush(self):
+		return
+
+class FrameEndpoint(TCPStreamIO, TCPFrameIO):
+	def __init__(self, socket):
+		super(FrameEndpoint, self).__init__()
+		self.socket = socket
+		self.stream_files_create()
+		return
+
+class CountingWriter(object):
+	def __init__(self, marker=None):
+		super(CountingWriter, self).__init__()
+		self.lock = threading.Lock()
+		self.received = 0
+		self.marker = marker
+		self.marks = set()
+		self.changed = threading.Condition(self.lock)
+		return
+
+	def write(self, string):
+		self.lock.acquire()
+		self.received += len(string)
+		if self.marker is not None and self.marker in string:
+			self.marks.update(int(line.split()[1]) for line in string.splitlines() if line.startswith(self.marker))
+		self.changed.notify_all()
+		self.lock.release()
+		return
+
+	def wait(self, predicate, timeout):
+		deadline = clock() + timeout
+		self.lock.acquire()
+		try:
+			while not predicate():
+				remaining = deadline - clock()
+				if remaining <= 0:
+					return False
+				self.changed.wait(remaining)
+			return True
+		finally:
+			self.lock.release()
+		return
+
+def percentiles(values):
+	values = sorted(values)
+	pick = lambda fraction: values[min(int(fraction * len(values)), len(values) - 1)] if values else None
+	return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': values[-1] if values else None}
+
+def memory_usage():
+	try:
+		with open('/proc/self/statm') as fobj:
+			return int(fobj.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (IOError, OSError, ValueError, AttributeError):
+		pass
+	try:
+		import resource
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+	except ImportError:
+		return None
+
+def client_connect(server_address, writer):
+	client = TerminalClient(server_address)
+	if not client.connect():
+		raise RuntimeError('Could not connect to {0!r}.'.format(server_address))
+	client.print_start(writer)
+	return client
+
+def bench_frames(sizes, duration):
+	listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	listener.bind(('127.0.0.1', 0))
+	listener.listen(1)
+	sender_socket = socket.create_connection(listener.getsockname())
+	receiver_socket = listener.accept()[0]
+	listener.close()
+	sender, receiver = FrameEndpoint(sender_socket), FrameEndpoint(receiver_socket)
+	results = list()
+	for size in sizes:
+		payload = os.urandom(size)
+		state = {'frames': 0, 'stop': False}
+		def send_loop():
+			while not state['stop']:
+				sender.send_frame(payload)
+			sender.send_frame(b'\x00')
+			return
+		thread = threading.Thread(target=send_loop)
+		started = clock()
+		thread.start()
+		error = None
+		while True:
+			binary_data = receiver.recv_frame()
+			if binary_data is None:
+				error = 'Connection closed after {0} frames.'.format(state['frames'])
+				state['stop'] = True
+				break
+			if len(binary_data) != size:
+				break
+			state['frames'] += 1
+			if not state['stop'] and clock() - started >= duration:
+				state['stop'] = True
+		elapsed = clock() - started
+		thread.join()
+		result = {
+			'benchmark': 'frames',
+			'payload': size,
+			'frames': state['frames'],
+			'seconds': round(elapsed, 6),
+			'frames_per_second': round(state['frames'] / elapsed, 1),
+			'megabytes_per_second': round(state['frames'] * size / elapsed / 1048576.0, 3)
+		}
+		if error is not None:
+			result['error'] = error
+		results.append(result)
+		if error is not None:
+			break
+	sender.stream_files_remove()
+	receiver.stream_files_remove()
+	sender_socket.close()
+	receiver_socket.close()
+	return results
+
+def bench_fanout(server_address, client_counts, lines, timeout):
+	line = u'[BigWorld] fan-out benchmark line with some payload text\n'
+	results = list()
+	for count in client_counts:
+		writers = [CountingWriter() for index in range(count)]
+		clients = [client_connect(server_address, writer) for writer in writers]
+		time.sleep(0.2)
+		expected = lines * len(line)
+		started = clock()
+		clients[0].send_script('fanout.py', 'import sys\nwrite = sys.stdout.write\nfor index in range({0}):\n\twrite({1!r})\n'.format(lines, line))
+		complete = all(writer.wait(lambda writer=writer: writer.received >= expected, timeout) for writer in writers)
+		elapsed = clock() - started
+		for client in clients:
+			client.disconnect()
+		results.append({
+			'benchmark': 'fanout',
+			'clients': count,
+			'lines': lines,
+			'complete': complete,
+			'seconds': round(elapsed, 6),
+			'lines_per_second': round(count * lines / elapsed, 1),
+			'megabytes_per_second': round(count * expected / elapsed / 1048576.0, 3)
+		})
+	return results
+
+def bench_rtt(server_address, count, timeout):
+	results = list()
+	for coalescing in (True, False):
+		writer = CountingWriter(u'rtt ')
+		client = client_connect(server_address, writer)
+		if not coalescing:
+			client.log_coalescing(0.0, 0)
+		samples = list()
+		for index in range(count):
+			started = clock()
+			client.send_script('rtt.py', 'print("rtt {0}")'.format(index))
+			if not writer.wait(lambda: index in writer.marks, timeout):
+				break
+			samples.append(clock() - started)
+		client.disconnect()
+		result = {'benchmark': 'rtt', 'coalescing': coalescing, 'samples': len(samples)}
+		result.update((key, round(value * 1000.0, 3) if value is not None else None) for key, value in percentiles(samples).items())
+		results.append(result)
+	return results
+
+def bench_memory(server_address, duration, interval):
+	writer = CountingWriter()
+	client = client_connect(server_address, writer)
+	samples = list()
+	def sample():
+		gc.collect()
+		samples.append((clock(), memory_usage(), len(gc.get_objects())))
+		return
+	# First and last samples are always taken, growth is measured even when duration is below interval.
+	sample()
+	started = clock()
+	index = 0
+	while clock() - started < duration:
+		client.send_script('memory.py', 'import sys\nvalue_{0} = [{0}] * 64\nfor index in range(100):\n\tsys.stdout.write(u"memory {0} %d\\n" % index)\n'.format(index))
+		index += 1
+		if clock() - samples[-1][0] >= interval:
+			sample()
+		time.sleep(0.001)
+	sample()
+	client.disconnect()
+	first, last = samples[0], samples[-1]
+	return [{
+		'benchmark': 'memory',
+		'scripts': index,
+		'seconds': round(last[0] - first[0], 3),
+		'rss_start': first[1],
+		'rss_end': last[1],
+		'rss_growth': last[1] - first[1] if first[1] is not None and last[1] is not None else None,
+		'objects_start': first[2],
+		'objects_end': last[2],
+		'samples': [[round(moment - first[0], 3), rss, objects] for moment, rss, objects in samples]
+	}]
+
+def bench_bwlog(server, count):
+	origin = lambda prefix, msg, *args, **kwargs: None
+	hook = server.log_hook('DEBUG', origin)
+	results = list()
+	# "default" is the shipped configuration: no clients, buffer keeps every level.
+	for case, levels, function in (('unhooked', None, origin), ('default', server.log_buffer_levels, hook), ('unbuffered', (), hook)):
+		server.log_buffer_subscribe(levels)
+		started = clock()
+		for index in range(count):
+			function('Bench', 'bwlog benchmark message')
+		elapsed = clock() - started
+		results.append({'benchmark': 'bwlog', 'case': case, 'calls': count, 'seconds': round(elapsed, 6), 'nanoseconds_per_call': round(elapsed / count * 1e9, 1)})
+	server.log_buffer_subscribe(server.log_buffer_levels)
+	return results
+
+def main():
+	parser = argparse.ArgumentParser(description='WoT Script Terminal loopback benchmarks.')
+	parser.add_argument('--mode', default='threaded', choices=('threaded', 'reactor'))
+	parser.add_argument('--benchmarks', default='frames,fanout,rtt,memory,bwlog')
+	parser.add_argument('--sizes', default='64,1024,16384,262144,1048576')
+	parser.add_argument('--duration', type=float, default=1.0)
+	parser.add_argument('--clients', default='1,4,16')
+	parser.add_argument('--lines', type=int, default=20000)
+	parser.add_argument('--rtt-count', type=int, default=200)
+	parser.add_argument('--memory-duration', type=float, default=10.0)
+	parser.add_argument('--bwlog-count', type=int, default=200000)
+	parser.add_argument('--timeout', type=float, default=30.0)
+	parser.add_argument('--output', default=None, help='append JSON lines to file instead of stdout')
+	args = parser.parse_args()
+	output = open(args.output, 'a') if args.output else sys.stdout
+	benchmarks = args.benchmarks.split(',')
+	# Server output goes to tee targets, keep it away from results.
+	sys.stdout, sys.stderr = NullStream(), NullStream()
+	loop = TickLoop()
+	controller = TerminalController(('127.0.0.1', 0), TerminalHandler, server_mode=args.mode, tick_hook=loop.callback)
+	loop.start()
+	server_address = controller.server.socket.getsockname()
+	environment = {'python': sys.version.split()[0], 'platform': sys.platform, 'mode': args.mode}
+	results = list()
+	if 'frames' in benchmarks:
+		results.extend(bench_frames([int(size) for size in args.sizes.split(',')], args.duration))
+	if 'fanout' in benchmarks:
+		results.extend(bench_fanout(server_address, [int(count) for count in args.clients.split(',')], args.lines, args.timeout))
+	if 'rtt' in benchmarks:
+		results.extend(bench_rtt(server_address, args.rtt_count, args.timeout))
+	if 'memory' in benchmarks:
+		results.extend(bench_memory(server_address, args.memory_duration, 1.0))
+	if 'bwlog' in benchmarks:
+		results.extend(bench_bwlog(controller.server, args.bwlog_count))
+	for result in results:
+		result.update(environment)
+		output.write(json.dumps(result, sort_keys=True) + '\n')
+	output.flush()
+	loop.stop()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
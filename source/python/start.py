@@ -1,4 +1,13 @@
+import sys
+
+from terminal.scheduler import TickLoop
 from terminal.server import TerminalHandler, TerminalController
 
-host, port = 'localhost', 9999
-controller = TerminalController((host, port), TerminalHandler)
+host, port, mode = 'localhost', 9999, 'threaded'
+loop = TickLoop()
+controller = TerminalController((host, port), TerminalHandler, server_mode=mode, tick_hook=loop.callback)
+if sys.flags.interactive:
+	# Interactive console keeps the main thread, scripts are run by loop thread instead.
+	loop.start()
+else:
+	loop.run()
@@ -1,7 +1,8 @@
 # *************************
 # Python 3
 # *************************
-# Nothing
+import threading
+import collections
 
 # *************************
 # SublimeText
@@ -10,6 +11,14 @@ import sublime
 import sublime_plugin
 
 class ViewController(object):
+	update_interval = 50
+	view_max_lines = 0
+	view_max_chars = 0
+	view_trim_ratio = 0.25
+	view_history_key = 'script_terminal_log_offset'
+	view_history_size_key = 'script_terminal_log_history_size'
+	view_history_encoding = 'utf-8'
+
 	@staticmethod
 	def create_file_view(window, name, scratch=False, read_only=False):
 		view = window.new_file()
@@ -18,19 +27,55 @@ class ViewController(object):
 		view.set_read_only(read_only)
 		return view
 
-	@staticmethod
-	def view_append_string(view, edit, string):
+	def view_append_string(self, view, edit, string):
 		read_only = view.is_read_only()
 		view.set_read_only(False)
 		view.insert(edit, view.size(), string)
+		self.view_trim(view, edit)
+		view.set_read_only(read_only)
+		return
+
+	def view_prepend_string(self, view, edit, string):
+		read_only = view.is_read_only()
+		view.set_read_only(False)
+		view.insert(edit, 0, string)
+		# Loaded history raises the view limits, otherwise next live line would trim it away.
+		lines, chars = view.settings().get(self.view_history_size_key, [0, 0])
+		view.settings().set(self.view_history_size_key, [lines + string.count('\n'), chars + len(string)])
 		view.set_read_only(read_only)
 		return
 
+	def view_trim(self, view, edit):
+		settings = view.settings()
+		history_lines, history_chars = settings.get(self.view_history_size_key, [0, 0])
+		max_chars = self.view_max_chars + history_chars if self.view_max_chars else 0
+		max_lines = self.view_max_lines + history_lines if self.view_max_lines else 0
+		size = view.size()
+		cut = 0
+		if max_chars and size > max_chars * (1.0 + self.view_trim_ratio):
+			cut = size - max_chars
+		if max_lines:
+			lines = view.rowcol(size)[0] + 1
+			if lines > max_lines * (1.0 + self.view_trim_ratio):
+				cut = max(cut, view.text_point(lines - max_lines, 0))
+		if cut:
+			line = view.line(cut)
+			if line.begin() != cut:
+				cut = min(line.end() + 1, size)
+			region = sublime.Region(0, cut)
+			offset = settings.get(self.view_history_key)
+			if offset is not None:
+				# Offset is a byte position in log history, move it past the erased text.
+				settings.set(self.view_history_key, offset + len(view.substr(region).encode(self.view_history_encoding)))
+			view.erase(edit, region)
+		return
+
 	@staticmethod
 	def view_clear(view, edit):
 		read_only = view.is_read_only()
 		view.set_read_only(False)
 		view.erase(edit, sublime.Region(0, view.size()))
+		view.settings().erase(ViewController.view_history_size_key)
 		view.set_read_only(read_only)
 		return
 
@@ -42,6 +87,9 @@ class ViewController(object):
 	def __init__(self):
 		super(ViewController, self).__init__()
 		self.views = dict()
+		self.updates_lock = threading.Lock()
+		self.updates = collections.OrderedDict()
+		self.updates_scheduled = False
 		return
 
 	def create_file(self, window, name, scratch=False, read_only=False):
@@ -62,10 +110,32 @@ class ViewController(object):
 		self.views.pop(view.id(), None)
 		return
 
+	def show_output(self, window, name):
+		panel = 'output.' + name
+		active_panel = getattr(window, 'active_panel', None)
+		if active_panel is None or active_panel() != panel:
+			window.run_command('show_panel', {'panel': panel})
+		return
+
 	def update_views(self, update_command, string, output_name=None):
-		if output_name is not None:
-			self.create_output(sublime.active_window(), output_name, True)
-			sublime.active_window().run_command('show_panel', {'panel': 'output.' + output_name})
-		for view_id in self.views.keys():
-			sublime.View(view_id).run_command(update_command, {'string': string})
+		self.updates_lock.acquire()
+		self.updates.setdefault((update_command, output_name), list()).append(string)
+		schedule, self.updates_scheduled = not self.updates_scheduled, True
+		self.updates_lock.release()
+		if schedule:
+			sublime.set_timeout(self.update_views_flush, self.update_interval)
+		return
+
+	def update_views_flush(self):
+		self.updates_lock.acquire()
+		updates, self.updates = self.updates, collections.OrderedDict()
+		self.updates_scheduled = False
+		self.updates_lock.release()
+		for (update_command, output_name), strings in updates.items():
+			if output_name is not None:
+				self.create_output(sublime.active_window(), output_name, True)
+				self.show_output(sublime.active_window(), output_name)
+			string = ''.join(strings)
+			for view_id in list(self.views.keys()):
+				sublime.View(view_id).run_command(update_command, {'string': string})
 		return
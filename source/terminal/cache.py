@@ -0,0 +1,125 @@
+# *************************
+# Python
+# *************************
+import marshal
+import linecache
+import threading
+import collections
+
+# *************************
+# Package
+# *************************
+# Nothing
+
+class CodeCache(object):
+	def __init__(self, count_limit=256, size_limit=16777216):
+		super(CodeCache, self).__init__()
+		self.count_limit = count_limit
+		self.size_limit = size_limit
+		self.lock = threading.Lock()
+		self.entries = collections.OrderedDict()
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		return
+
+	def get(self, digest):
+		self.lock.acquire()
+		try:
+			entry = self.entries.pop(digest, None)
+			if entry is None:
+				self.misses += 1
+				return None
+			self.entries[digest] = entry
+			self.hits += 1
+			return entry[0]
+		finally:
+			self.lock.release()
+		return
+
+	def add(self, digest, code, source):
+		size = len(source) + len(marshal.dumps(code))
+		self.lock.acquire()
+		try:
+			previous = self.entries.pop(digest, None)
+			if previous is not None:
+				self.size -= previous[1]
+			self.entries[digest] = code, size
+			self.size += size
+			while len(self.entries) > 1 and (len(self.entries) > self.count_limit or self.size > self.size_limit):
+				self.size -= self.entries.popitem(last=False)[1][1]
+		finally:
+			self.lock.release()
+		return code
+
+	def stats(self):
+		return {'entries': len(self.entries), 'size': self.size, 'hits': self.hits, 'misses': self.misses}
+
+	def clear(self):
+		self.lock.acquire()
+		self.entries.clear()
+		self.size = 0
+		self.lock.release()
+		return
+
+class ScriptLineCache(object):
+	def __init__(self, count_limit=256, size_limit=8388608):
+		super(ScriptLineCache, self).__init__()
+		self.count_limit = count_limit
+		self.size_limit = size_limit
+		self.lock = threading.Lock()
+		self.entries = collections.OrderedDict()
+		self.size = 0
+		self.evicted = 0
+		return
+
+	def add(self, filename, script, digest):
+		entry = len(script), None, [line + '\n' for line in script.split('\n')], None
+		self.lock.acquire()
+		try:
+			self.discard(filename)
+			# mtime None keeps linecache.checkcache from dropping the entry.
+			linecache.cache[filename] = entry
+			self.entries[filename] = entry, digest
+			self.size += entry[0]
+			while len(self.entries) > 1 and (len(self.entries) > self.count_limit or self.size > self.size_limit):
+				self.discard(next(iter(self.entries)))
+				self.evicted += 1
+		finally:
+			self.lock.release()
+		return
+
+	def touch(self, filename, digest):
+		self.lock.acquire()
+		try:
+			entry, entry_digest = self.entries.pop(filename, (None, None))
+			if entry is None:
+				return False
+			if linecache.cache.get(filename) is not entry:
+				# Replaced or cleared by someone else, it is not ours anymore.
+				self.size -= entry[0]
+				return False
+			self.entries[filename] = entry, entry_digest
+			# Lines of another version under the same name would mislead tracebacks.
+			return entry_digest == digest
+		finally:
+			self.lock.release()
+		return
+
+	def discard(self, filename):
+		entry, digest = self.entries.pop(filename, (None, None))
+		if entry is not None:
+			self.size -= entry[0]
+			if linecache.cache.get(filename) is entry:
+				linecache.cache.pop(filename, None)
+		return
+
+	def stats(self):
+		return {'entries': len(self.entries), 'size': self.size, 'evicted': self.evicted}
+
+	def clear(self):
+		self.lock.acquire()
+		for filename in list(self.entries):
+			self.discard(filename)
+		self.lock.release()
+		return
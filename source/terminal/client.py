@@ -1,31 +1,43 @@
 # *************************
 # Python
 # *************************
-import io
 import sys
 import zlib
 import marshal
+import threading
+import collections
 
 # *************************
 # Package
 # *************************
+from .protocol import MESSAGE_LOGS, MESSAGE_SCRIPT_MISS, MESSAGE_HELLO, MESSAGE_LOG_COMPRESSION, MESSAGE_PROFILE, message_loads
+from .protocol import MESSAGE_SAMPLES, MESSAGE_STATS
+from .protocol import FRAME_ZLIB_DICTIONARY, FRAME_DICTIONARY, FrameCodec
+from .protocol import REQUEST_SCRIPT, REQUEST_SCRIPT_HASH, REQUEST_SCRIPT_DROP, REQUEST_SCRIPT_DELTA
+from .protocol import script_digest, script_delta
+from .profiler import profile_format
 from .sockets import ThreadCaller, TCPStreamClient, TCPStreamIO, TCPFrameIO
 
 class TerminalClient(TCPStreamClient, TCPStreamIO, TCPFrameIO, ThreadCaller):
 	encoding = 'utf-8'
 	auto_disconnect = True
+	script_hashing = True
+	script_hash_threshold = 1024
+	script_memory = 64
+	script_delta_ratio = 0.5
+	script_delta_lines = 8192
+	frame_dictionary = FRAME_DICTIONARY
 
 	def __init__(self, *args, **kwargs):
 		super(TerminalClient, self).__init__(*args, **kwargs)
 		self.connected = False
-		return
-
-	def io_create(self):
-		self.reader = io.TextIOWrapper(io.BufferedReader(self.rfile, buffer_size=1), encoding=self.encoding, line_buffering=True)
-		return
-
-	def io_remove(self):
-		self.reader = None
+		self.send_lock = threading.RLock()
+		self.scripts = collections.OrderedDict()
+		self.versions = dict()
+		self.codec = None
+		self.samples = list()
+		self.samples_chunk_size = 262144
+		self.log_cursor = None
 		return
 
 	def connect(self):
@@ -34,7 +46,6 @@ class TerminalClient(TCPStreamClient, TCPStreamIO, TCPFrameIO, ThreadCaller):
 		if self.client_init():
 			if self.client_connect():
 				self.stream_files_create()
-				self.io_create()
 				self.connected = True
 				return True
 			try:
@@ -51,10 +62,6 @@ class TerminalClient(TCPStreamClient, TCPStreamIO, TCPFrameIO, ThreadCaller):
 		if not self.connected:
 			raise RuntimeError('Client is not connected to server.')
 		self.connected = False
-		try:
-			self.io_remove()
-		except:
-			pass
 		try:
 			self.stream_files_remove()
 		except:
@@ -69,35 +76,157 @@ class TerminalClient(TCPStreamClient, TCPStreamIO, TCPFrameIO, ThreadCaller):
 			pass
 		return
 
+	def send_request(self, request_type, data):
+		self.send_lock.acquire()
+		try:
+			binary_data = marshal.dumps((request_type, data), 2)
+			result = self.send_frame(self.codec.encode(binary_data) if self.codec is not None else zlib.compress(binary_data))
+		finally:
+			self.send_lock.release()
+		if not result and self.auto_disconnect and self.connected:
+			self.disconnect()
+		return result
+
+	def script_name(self, filename):
+		return '{0[0]}:{0[1]}|{1}'.format(self.client_address, filename)
+
 	def send_script(self, filename, script):
 		if self.client_address is not None:
-			filename = '{0[0]}:{0[1]}|{1}'.format(self.client_address, filename)
-			result = self.send_frame(zlib.compress(marshal.dumps((filename, script), 2)))
-			if not result and self.auto_disconnect and self.connected:
-				self.disconnect()
-			return result
+			filename = self.script_name(filename)
+			if self.script_hashing and len(script) >= self.script_hash_threshold:
+				digest = script_digest(filename, script)
+				self.send_lock.acquire()
+				try:
+					self.scripts.pop(digest, None)
+					self.scripts[digest] = filename, script
+					while len(self.scripts) > self.script_memory:
+						self.scripts.popitem(last=False)
+					base_digest, base = self.versions.get(filename, (None, None))
+					if base is not None and base_digest != digest:
+						delta = script_delta(base, script, self.script_delta_lines)
+						if delta is not None and len(marshal.dumps(delta, 2)) < len(script) * self.script_delta_ratio:
+							self.versions[filename] = digest, script
+							return self.send_request(REQUEST_SCRIPT_DELTA, (filename, base_digest, digest, delta))
+					return self.send_request(REQUEST_SCRIPT_HASH, (filename, digest))
+				finally:
+					self.send_lock.release()
+			return self.send_request(REQUEST_SCRIPT, (filename, script))
 		return False
 
+	def script_upload(self, digest):
+		self.send_lock.acquire()
+		try:
+			entry = self.scripts.get(digest)
+			if entry is None:
+				return self.send_request(REQUEST_SCRIPT_DROP, digest)
+			self.versions[entry[0]] = digest, entry[1]
+			return self.send_request(REQUEST_SCRIPT, entry)
+		finally:
+			self.send_lock.release()
+
+	def frames_negotiate(self, frame_flags, dictionary_id):
+		dictionary = self.frame_dictionary
+		if FRAME_ZLIB_DICTIONARY not in frame_flags or FrameCodec.dictionary_id(dictionary) != dictionary_id:
+			dictionary = None
+		self.codec = FrameCodec(dictionary)
+		return
+
+	def profile_script(self, filename, script, top=25, raw=False):
+		self.send_lock.acquire()
+		try:
+			# Options are bound to the digest, a script that fails to compile leaves nothing armed for the next one.
+			digest = script_digest(self.script_name(filename), script) if self.client_address is not None else None
+			return self.send_command('profile_next({!r}, {!r}, {!r});'.format(top, raw, digest)) and self.send_script(filename, script)
+		finally:
+			self.send_lock.release()
+
 	def send_command(self, script):
 		return self.send_script('<command>', script)
 
 	def update_locals(self, uuid):
 		return self.send_command('update_locals({!r})'.format(uuid))
 
-	def fetch_logs(self):
-		return self.send_command('fetch_logs();')
+	def log_coalescing(self, delay=None, size=None):
+		return self.send_command('log_coalescing({!r}, {!r});'.format(delay, size))
+
+	def log_subscribe(self, streams=None, levels=None, pattern=None, prefixes=None):
+		return self.send_command('log_subscribe({!r}, {!r}, {!r}, {!r});'.format(streams, levels, pattern, prefixes))
+
+	def log_compression(self, level=6):
+		return self.send_command('log_compression({!r});'.format(level))
+
+	def sampling_start(self, interval=0.005):
+		return self.send_command('sampling_start({!r});'.format(interval))
+
+	def sampling_stop(self):
+		return self.send_command('sampling_stop();')
+
+	def sampling_clear(self):
+		return self.send_command('sampling_clear();')
+
+	def sampling_fetch(self, chunk_size=262144):
+		self.samples = list()
+		self.samples_chunk_size = chunk_size
+		return self.send_command('sampling_fetch(0, {!r});'.format(chunk_size))
+
+	def stats_report(self):
+		return self.send_command('stats(True);')
+
+	def fetch_logs(self, since=None):
+		if since is None and self.log_cursor is not None:
+			return self.send_command('fetch_logs({0[1]!r}, {0[0]!r});'.format(self.log_cursor))
+		return self.send_command('fetch_logs({!r});'.format(since) if since is not None else 'fetch_logs();')
+
+	def log_cursor_update(self, cursor):
+		epoch, sequence = cursor
+		if self.log_cursor is None or self.log_cursor[0] != epoch or self.log_cursor[1] < sequence:
+			self.log_cursor = (epoch, sequence)
+		return
 
 	def print_loop(self, writer = None):
 		if writer is None:
 			writer = sys.stdout
 		if not self.connected:
 			raise RuntimeError('Client is not connected to server.')
+		decompressor = None
 		while True:
 			try:
-				line = self.reader.readline()
-				if not line:
+				binary_data = self.recv_frame()
+				if not binary_data:
 					break
-				writer.write(line)
+				if decompressor is not None:
+					binary_data = decompressor.decompress(binary_data)
+				message_type, data = message_loads(binary_data)
+				if message_type == MESSAGE_LOGS:
+					cursor, records = data
+					if records:
+						writer.write(''.join(string for stream_id, string in records))
+					self.log_cursor_update(cursor)
+				elif message_type == MESSAGE_SCRIPT_MISS:
+					self.script_upload(data)
+				elif message_type == MESSAGE_HELLO:
+					self.frames_negotiate(*data)
+				elif message_type == MESSAGE_LOG_COMPRESSION:
+					decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+				elif message_type == MESSAGE_PROFILE:
+					if hasattr(writer, 'profile'):
+						writer.profile(data)
+					else:
+						writer.write(profile_format(data))
+				elif message_type == MESSAGE_STATS:
+					if hasattr(writer, 'stats'):
+						writer.stats(data)
+					else:
+						writer.write(data + '\n')
+				elif message_type == MESSAGE_SAMPLES:
+					offset, total, chunk = data
+					self.samples.append(chunk)
+					if chunk and offset + len(chunk) < total:
+						self.send_command('sampling_fetch({!r}, {!r});'.format(offset + len(chunk), self.samples_chunk_size))
+					elif hasattr(writer, 'samples'):
+						writer.samples(''.join(self.samples))
+					else:
+						writer.write(''.join(self.samples))
 			except:
 				break
 		if self.auto_disconnect and self.connected:
@@ -0,0 +1,328 @@
+# *************************
+# Python
+# *************************
+import os
+import re
+import mmap
+import shutil
+import tempfile
+import itertools
+import threading
+import collections
+
+# *************************
+# Package
+# *************************
+from .protocol import STREAM_NAMES, LOG_LEVELS
+
+text_type = type(u'')
+
+class LogSubscription(object):
+	def __init__(self, streams=None, levels=None, pattern=None, prefixes=None):
+		super(LogSubscription, self).__init__()
+		self.streams = frozenset(STREAM_NAMES.get(stream, stream) for stream in streams) if streams is not None else None
+		self.levels = frozenset(level.upper() for level in levels) if levels is not None else None
+		self.pattern = re.compile(pattern) if pattern else None
+		self.prefixes = tuple(prefixes) if prefixes else None
+		return
+
+	def accepts(self, stream_id, string, level=None):
+		if self.streams is not None and stream_id not in self.streams:
+			return False
+		# Level filter only applies to records that carry a level, i.e. BigWorld log records.
+		if self.levels is not None and level is not None and level not in self.levels:
+			return False
+		if self.prefixes is not None and not string.startswith(self.prefixes):
+			return False
+		if self.pattern is not None and self.pattern.search(string) is None:
+			return False
+		return True
+
+	def stream_levels(self, stream_id):
+		if self.streams is not None and stream_id not in self.streams:
+			return frozenset()
+		return self.levels if self.levels is not None else LOG_LEVELS
+
+class LogRecordWriter(object):
+	urgent_markers = (u'Traceback (most recent call last)', )
+
+	def __init__(self, wfile, stream_id, keep_level=False):
+		super(LogRecordWriter, self).__init__()
+		self.wfile = wfile
+		self.stream_id = stream_id
+		self.keep_level = keep_level
+		self.subscription = None
+		return
+
+	def write(self, string, level=None):
+		if not isinstance(string, text_type):
+			raise TypeError('string argument expected, got {0!r}'.format(type(string).__name__))
+		if self.subscription is not None and not self.subscription.accepts(self.stream_id, string, level):
+			return 0
+		record = (self.stream_id, string, level) if self.keep_level else (self.stream_id, string)
+		result = self.wfile.enqueue(record, len(string))
+		for marker in self.urgent_markers:
+			if marker in string:
+				self.wfile.flush()
+				break
+		return result
+
+	def writelines(self, lines):
+		for line in lines:
+			self.write(line)
+		return
+
+	def flush(self):
+		self.wfile.flush()
+		return
+
+class LogRingBuffer(object):
+	gap_format = u'-' * 40 + u'\n{0} log records were evicted from server buffer.\n' + u'-' * 40 + u'\n'
+
+	def __init__(self, capacity=16384, size_limit=4194304):
+		super(LogRingBuffer, self).__init__()
+		self.capacity = capacity
+		self.size_limit = size_limit
+		self.lock = threading.Lock()
+		self.records = collections.deque()
+		self.size = 0
+		self.first_seq = 0
+		self.next_seq = 0
+		self.writers = dict()
+		# Cheap intake for hot producers: (index, record) appended under a small lock of its own, drained in order under the main lock.
+		self.spool_lock = threading.Lock()
+		self.spool = collections.deque(maxlen=capacity)
+		self.spool_counter = itertools.count()
+		self.spool_next = 0
+		return
+
+	def writer(self, stream_id):
+		if stream_id not in self.writers:
+			self.writers[stream_id] = LogRecordWriter(self, stream_id, True)
+		return self.writers[stream_id]
+
+	def capture(self, record):
+		# Index and append must not be split, a producer switched out in between would land out of order.
+		self.spool_lock.acquire()
+		self.spool.append((next(self.spool_counter), record))
+		self.spool_lock.release()
+		return
+
+	@staticmethod
+	def record_size(string):
+		if not isinstance(string, tuple):
+			return len(string)
+		try:
+			return len(string[0]) + len(string[1]) + 3
+		except TypeError:
+			return 64
+		return
+
+	def append(self, record, size):
+		self.records.append((record, size))
+		self.size += size
+		self.next_seq += 1
+		while len(self.records) > 1 and (len(self.records) > self.capacity or self.size > self.size_limit):
+			self.size -= self.records.popleft()[1]
+			self.first_seq += 1
+		return
+
+	def drain(self):
+		spool = self.spool
+		if not spool:
+			return
+		entries = list()
+		while spool:
+			entries.append(spool.popleft())
+		# Sorting keeps a late entry from reading as a gap, only an index past the next expected one is a loss.
+		entries.sort(key=lambda entry: entry[0])
+		for index, record in entries:
+			if index > self.spool_next:
+				# Spool overflowed, a full spool of newer records follows so everything buffered is evicted anyway.
+				self.records.clear()
+				self.size = 0
+				self.next_seq += index - self.spool_next
+				self.first_seq = self.next_seq
+			self.spool_next = max(self.spool_next, index + 1)
+			self.append(record, self.record_size(record[1]))
+		return
+
+	def enqueue(self, record, size):
+		if not size:
+			return 0
+		self.lock.acquire()
+		self.drain()
+		self.append(record, size)
+		self.lock.release()
+		return size
+
+	def flush(self):
+		return
+
+	def fetch(self, since=0, until=None):
+		self.lock.acquire()
+		try:
+			self.drain()
+			until = self.next_seq if until is None else min(until, self.next_seq)
+			since = min(max(since, 0), until)
+			evicted = max(self.first_seq - since, 0)
+			start = since + evicted - self.first_seq
+			records = [record for record, size in itertools.islice(self.records, start, max(until - self.first_seq, start))]
+			return evicted, records
+		finally:
+			self.lock.release()
+		return
+
+	def sequence(self):
+		self.lock.acquire()
+		self.drain()
+		next_seq = self.next_seq
+		self.lock.release()
+		return next_seq
+
+	def stats(self):
+		self.lock.acquire()
+		self.drain()
+		self.lock.release()
+		return {'records': len(self.records), 'size': self.size, 'first_seq': self.first_seq, 'next_seq': self.next_seq}
+
+	def clear(self):
+		self.lock.acquire()
+		self.drain()
+		self.records.clear()
+		self.size = 0
+		self.first_seq = self.next_seq
+		self.lock.release()
+		return
+
+class LogHistory(object):
+	encoding = 'utf-8'
+
+	def __init__(self, tail_limit=1048576, segment_size=4194304, segment_count=64):
+		super(LogHistory, self).__init__()
+		self.tail_limit = tail_limit
+		self.segment_size = segment_size
+		self.segment_count = segment_count
+		self.lock = threading.Lock()
+		self.tail = collections.deque()
+		self.tail_size = 0
+		self.path = None
+		self.segments = list()
+		self.segment_file = None
+		self.spilled = 0
+		return
+
+	def write(self, string):
+		if not string:
+			return 0
+		self.lock.acquire()
+		try:
+			self.tail.append(string)
+			self.tail_size += len(string)
+			if self.tail_size > self.tail_limit:
+				self.spill(self.tail_limit // 2)
+		finally:
+			self.lock.release()
+		return len(string)
+
+	def spill(self, keep):
+		strings = list()
+		while self.tail and self.tail_size > keep:
+			strings.append(self.tail.popleft())
+			self.tail_size -= len(strings[-1])
+		data = u''.join(strings).encode(self.encoding)
+		while data:
+			if self.segment_file is None:
+				self.segment_open()
+			base, path, size = self.segments[-1]
+			chunk = data[:max(self.segment_size - size, 0)] or data
+			self.segment_file.write(chunk)
+			self.segment_file.flush()
+			self.segments[-1] = base, path, size + len(chunk)
+			self.spilled += len(chunk)
+			data = data[len(chunk):]
+			if size + len(chunk) >= self.segment_size:
+				self.segment_close()
+		return
+
+	def segment_open(self):
+		if self.path is None:
+			self.path = tempfile.mkdtemp(prefix='WoTScriptTerminal-')
+		path = os.path.join(self.path, '{0:016x}.log'.format(self.spilled))
+		self.segment_file = open(path, 'ab')
+		self.segments.append((self.spilled, path, 0))
+		while len(self.segments) > self.segment_count:
+			base, path, size = self.segments.pop(0)
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+		return
+
+	def segment_close(self):
+		if self.segment_file is not None:
+			self.segment_file.close()
+			self.segment_file = None
+		return
+
+	@staticmethod
+	def segment_read(path, start, end):
+		with open(path, 'rb') as fobj:
+			mapping = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				return mapping[start:end]
+			finally:
+				mapping.close()
+		return
+
+	def recent(self):
+		self.lock.acquire()
+		try:
+			return self.spilled, u''.join(self.tail)
+		finally:
+			self.lock.release()
+		return
+
+	def older(self, offset, size):
+		self.lock.acquire()
+		try:
+			first = self.segments[0][0] if self.segments else self.spilled
+			offset = min(offset, self.spilled)
+			start = max(offset - size, first)
+			chunks = list()
+			for base, path, length in self.segments:
+				chunk_start, chunk_end = max(start, base), min(offset, base + length)
+				if chunk_start < chunk_end:
+					chunks.append(self.segment_read(path, chunk_start - base, chunk_end - base))
+		finally:
+			self.lock.release()
+		data = b''.join(chunks)
+		skip = 0
+		if start > 0:
+			new_line = data.find(b'\n')
+			skip = new_line + 1 if 0 <= new_line < len(data) - 1 else 0
+			while skip < len(data) and 0x80 <= bytearray(data[skip:skip + 1])[0] < 0xC0:
+				skip += 1
+		return start + skip, data[skip:].decode(self.encoding, 'replace')
+
+	def clear(self):
+		self.lock.acquire()
+		self.tail.clear()
+		self.tail_size = 0
+		self.close_files()
+		self.lock.release()
+		return
+
+	def close_files(self):
+		self.segment_close()
+		self.segments = list()
+		if self.path is not None:
+			shutil.rmtree(self.path, True)
+			self.path = None
+		return
+
+	def close(self):
+		self.lock.acquire()
+		self.close_files()
+		self.lock.release()
+		return
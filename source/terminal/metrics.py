@@ -0,0 +1,66 @@
+# *************************
+# Python
+# *************************
+import sys
+import time
+
+# *************************
+# Package
+# *************************
+# Nothing
+
+timer = getattr(time, 'perf_counter', time.clock if sys.platform == 'win32' else time.time)
+
+class LatencyHistogram(object):
+	bucket_count = 32
+
+	def __init__(self):
+		super(LatencyHistogram, self).__init__()
+		# Bucket N counts durations below 2 ** N microseconds, updates are left unlocked on purpose.
+		self.buckets = [0] * self.bucket_count
+		self.count = 0
+		self.total = 0.0
+		self.maximum = 0.0
+		return
+
+	def add(self, seconds):
+		self.buckets[min(int(seconds * 1000000.0).bit_length(), self.bucket_count - 1)] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.maximum:
+			self.maximum = seconds
+		return
+
+	def percentile(self, fraction):
+		rank = fraction * self.count
+		seen = 0
+		for index, count in enumerate(self.buckets):
+			seen += count
+			if count and seen >= rank:
+				return min((1 << index) / 1000000.0, self.maximum)
+		return self.maximum
+
+	def snapshot(self):
+		return {
+			'count': self.count,
+			'mean': self.total / self.count if self.count else 0.0,
+			'p50': self.percentile(0.5),
+			'p90': self.percentile(0.9),
+			'p99': self.percentile(0.99),
+			'max': self.maximum
+		}
+
+def stats_format(stats, indent=u''):
+	lines = list()
+	for key in sorted(stats):
+		value = stats[key]
+		if isinstance(value, dict) and 'p50' in value:
+			lines.append(u'{0}{1}: n={2[count]} mean={3:.3f}ms p50<={4:.3f}ms p90<={5:.3f}ms p99<={6:.3f}ms max={7:.3f}ms'.format(
+				indent, key, value, value['mean'] * 1000.0, value['p50'] * 1000.0, value['p90'] * 1000.0, value['p99'] * 1000.0, value['max'] * 1000.0
+			))
+		elif isinstance(value, dict):
+			lines.append(u'{0}{1}:'.format(indent, key))
+			lines.append(stats_format(value, indent + u'    '))
+		else:
+			lines.append(u'{0}{1}: {2}'.format(indent, key, value))
+	return u'\n'.join(line for line in lines if line)
@@ -0,0 +1,192 @@
+# *************************
+# Python
+# *************************
+import sys
+import time
+import pstats
+import marshal
+import threading
+import collections
+
+try:
+	import cProfile as profile
+except ImportError:
+	import profile
+
+# *************************
+# Package
+# *************************
+# Nothing
+
+text_type = type(u'')
+
+def profile_text(value):
+	return value if isinstance(value, text_type) else value.decode('utf-8', 'replace')
+
+def profile_function(key):
+	filename, line, name = key
+	return profile_text(filename), line, profile_text(name)
+
+def profile_label(function):
+	filename, line, name = function
+	return u'{0}:{1}({2})'.format(filename, line, name) if line else name
+
+class ScriptProfiler(object):
+	caller_count = 5
+
+	def __init__(self, top=25, raw=False):
+		super(ScriptProfiler, self).__init__()
+		self.top = top
+		self.raw = raw
+		self.profile = profile.Profile()
+		return
+
+	def run(self, function, *args):
+		return self.profile.runcall(function, *args)
+
+	@staticmethod
+	def caller_entry(value):
+		# cProfile stores (nc, cc, tt, ct) per caller, pure Python profile stores call count only.
+		return tuple(value) if isinstance(value, tuple) else (value, value, 0.0, 0.0)
+
+	def result(self, name):
+		stats = pstats.Stats(self.profile).stats
+		functions = dict()
+		for key, stat in stats.items():
+			for function in [key] + list(stat[4]):
+				if function not in functions:
+					functions[function] = profile_function(function)
+		by_cumulative = sorted(stats, key=lambda key: stats[key][3], reverse=True)[:self.top]
+		by_total = sorted(stats, key=lambda key: stats[key][2], reverse=True)[:self.top]
+		callers = list()
+		for key in by_cumulative:
+			entries = [functions[caller] + self.caller_entry(value) for caller, value in stats[key][4].items()]
+			callers.append(sorted(entries, key=lambda entry: entry[6], reverse=True)[:self.caller_count])
+		raw = None
+		if self.raw:
+			raw = dict(
+				(functions[key], (cc, nc, tt, ct, dict((functions[caller], value) for caller, value in callers_map.items())))
+				for key, (cc, nc, tt, ct, callers_map) in stats.items()
+			)
+		return (
+			profile_text(name),
+			sum(stat[1] for stat in stats.values()),
+			sum(stat[0] for stat in stats.values()),
+			sum(stat[2] for stat in stats.values()),
+			[functions[key] + tuple(stats[key][:4]) for key in by_cumulative],
+			[functions[key] + tuple(stats[key][:4]) for key in by_total],
+			callers,
+			raw
+		)
+
+class SamplingProfiler(object):
+	max_depth = 128
+
+	def __init__(self, interval=0.005):
+		super(SamplingProfiler, self).__init__()
+		self.interval = interval
+		self.lock = threading.Lock()
+		self.counts = collections.defaultdict(int)
+		self.labels = dict()
+		self.thread_names = dict()
+		self.samples = 0
+		self.thread = None
+		self.running = threading.Event()
+		return
+
+	def start(self, interval=None):
+		if interval is not None:
+			self.interval = interval
+		if self.thread is None or not self.thread.is_alive():
+			self.running.set()
+			self.thread = threading.Thread(target=self.sample_loop, name='SamplingProfiler')
+			self.thread.daemon = True
+			self.thread.start()
+		return
+
+	def stop(self):
+		self.running.clear()
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join()
+		self.thread = None
+		self.labels.clear()
+		return
+
+	def is_running(self):
+		return self.thread is not None and self.thread.is_alive()
+
+	def clear(self):
+		self.lock.acquire()
+		self.counts.clear()
+		self.labels.clear()
+		self.samples = 0
+		self.lock.release()
+		return
+
+	def label(self, code):
+		# Keyed by location, holding code objects would keep every sampled exec'd script alive.
+		key = (code.co_filename, code.co_name, code.co_firstlineno)
+		label = self.labels.get(key)
+		if label is None:
+			label = self.labels[key] = u'{0} ({1}:{2})'.format(profile_text(code.co_name), profile_text(code.co_filename), code.co_firstlineno).replace(u';', u':')
+		return label
+
+	def sample(self):
+		own_thread_id = threading.current_thread().ident
+		frames = sys._current_frames()
+		if any(thread_id not in self.thread_names for thread_id in frames):
+			self.thread_names = dict((thread.ident, profile_text(thread.name).replace(u';', u':')) for thread in threading.enumerate())
+		stacks = list()
+		for thread_id, frame in frames.items():
+			if thread_id == own_thread_id:
+				continue
+			stack = list()
+			while frame is not None and len(stack) < self.max_depth:
+				stack.append(self.label(frame.f_code))
+				frame = frame.f_back
+			stack.append(self.thread_names.get(thread_id, u'thread-{0}'.format(thread_id)))
+			stacks.append(tuple(reversed(stack)))
+		frames = frame = None
+		self.lock.acquire()
+		for stack in stacks:
+			self.counts[stack] += 1
+		self.samples += 1
+		self.lock.release()
+		return
+
+	def sample_loop(self):
+		while self.running.is_set():
+			started = time.time()
+			self.sample()
+			time.sleep(max(self.interval - (time.time() - started), 0.0))
+		return
+
+	def collapsed(self):
+		self.lock.acquire()
+		counts = list(self.counts.items())
+		self.lock.release()
+		return u''.join(u'{0} {1}\n'.format(u';'.join(stack), count) for stack, count in sorted(counts))
+
+def profile_calls(nc, cc):
+	return u'{0}/{1}'.format(nc, cc) if nc != cc else u'{0}'.format(nc)
+
+def profile_format(result):
+	name, calls, primitive_calls, total_time, cumulative, total, callers, raw = result
+	lines = [u'Profile: {0}'.format(name), u'{0} function calls ({1} primitive calls) in {2:.6f} seconds'.format(calls, primitive_calls, total_time)]
+	for title, rows in ((u'cumulative time', cumulative), (u'internal time', total)):
+		lines.extend([u'', u'Ordered by: {0}'.format(title), u'{0:>12} {1:>10} {2:>10}  {3}'.format(u'ncalls', u'tottime', u'cumtime', u'function')])
+		for filename, line, function, cc, nc, tt, ct in rows:
+			lines.append(u'{0:>12} {1:>10.6f} {2:>10.6f}  {3}'.format(profile_calls(nc, cc), tt, ct, profile_label((filename, line, function))))
+	lines.extend([u'', u'Callers (ordered by cumulative time):'])
+	for row, entries in zip(cumulative, callers):
+		lines.append(profile_label(row[:3]))
+		for filename, line, function, nc, cc, tt, ct in entries:
+			lines.append(u'    <- {0:>12} {1:>10.6f}  {2}'.format(profile_calls(nc, cc), ct, profile_label((filename, line, function))))
+	return u'\n'.join(lines) + u'\n'
+
+def profile_dump(result, path):
+	if result[7] is None:
+		raise ValueError('Profile result does not contain raw stats.')
+	with open(path, 'wb') as fobj:
+		marshal.dump(result[7], fobj)
+	return
@@ -0,0 +1,155 @@
+# *************************
+# Python
+# *************************
+import zlib
+import struct
+import difflib
+import hashlib
+import marshal
+
+# *************************
+# Package
+# *************************
+# Nothing
+
+STREAM_STDOUT = 0
+STREAM_STDERR = 1
+STREAM_BWLOG = 2
+STREAM_NAMES = {'stdout': STREAM_STDOUT, 'stderr': STREAM_STDERR, 'bwlog': STREAM_BWLOG}
+LOG_LEVELS = frozenset(('TRACE', 'DEBUG', 'INFO', 'NOTICE', 'WARNING', 'ERROR', 'CRITICAL', 'HACK'))
+
+MESSAGE_LOGS = 1
+MESSAGE_SCRIPT_MISS = 2
+MESSAGE_HELLO = 3
+MESSAGE_LOG_COMPRESSION = 4
+MESSAGE_PROFILE = 5
+MESSAGE_SAMPLES = 6
+MESSAGE_STATS = 7
+
+REQUEST_SCRIPT = 1
+REQUEST_SCRIPT_HASH = 2
+REQUEST_SCRIPT_DROP = 3
+REQUEST_SCRIPT_DELTA = 4
+
+FRAME_RAW = 0
+FRAME_ZLIB = 1
+FRAME_ZLIB_DICTIONARY = 2
+
+FRAME_DICTIONARY = b''.join([
+	b'except Exception:\n\t\timport traceback\n\t\ttraceback.print_exc()\n',
+	b'import functools\nimport itertools\nimport collections\nimport weakref\n',
+	b'from helpers import dependency\nfrom skeletons.gui.shared import IItemsCache\n',
+	b'from gui.shared import g_eventBus, events, EVENT_BUS_SCOPE\nfrom gui.shared.utils.requesters import REQ_CRITERIA\n',
+	b'from gui.Scaleform.framework import ViewTypes\nfrom gui.app_loader import g_appLoader\n',
+	b'from gui.battle_control import avatar_getter\nfrom items import vehicles\n',
+	b'from Avatar import PlayerAvatar\nfrom Vehicle import Vehicle\nfrom Account import PlayerAccount\n',
+	b'from CurrentVehicle import g_currentVehicle\nfrom PlayerEvents import g_playerEvents\n',
+	b'from debug_utils import LOG_CURRENT_EXCEPTION, LOG_ERROR, LOG_NOTE, LOG_DEBUG\n',
+	b'import BigWorld\nimport ResMgr\nimport Math\nimport GUI\nimport Keys\nimport Event\n',
+	b'BigWorld.player()\nBigWorld.entities.values()\nBigWorld.callback(0.0, \nBigWorld.cancelCallback(\n',
+	b'BigWorld.time()\nBigWorld.serverTime()\nBigWorld.camera()\nMath.Vector3(\nMath.Matrix()\n',
+	b'player = BigWorld.player()\nvehicle = player.getVehicleAttached()\nvehicle.typeDescriptor\n',
+	b'isinstance(\ngetattr(\nsetattr(\nhasattr(\nlambda \nreturn None\nreturn self.\n',
+	b'\tdef __init__(self, *args, **kwargs):\n\t\tsuper(\nself.\n'
+])
+
+def message_dumps(message_type, data):
+	return marshal.dumps((message_type, data), 2)
+
+def message_loads(binary_data):
+	return marshal.loads(binary_data)
+
+def script_digest(filename, script):
+	return hashlib.sha1(filename.encode('utf-8') + b'\x00' + script.encode('utf-8')).hexdigest()
+
+def script_delta(base, script, line_limit=None):
+	base_lines, script_lines = base.split('\n'), script.split('\n')
+	# Common head and tail are cut before diffing, edits usually touch a few lines in between.
+	shortest = min(len(base_lines), len(script_lines))
+	head = 0
+	while head < shortest and base_lines[head] == script_lines[head]:
+		head += 1
+	tail = 0
+	while tail < shortest - head and base_lines[-tail - 1] == script_lines[-tail - 1]:
+		tail += 1
+	base_lines, script_lines = base_lines[head:len(base_lines) - tail], script_lines[head:len(script_lines) - tail]
+	# Diff time grows with the product of both sides, past the limit the caller sends the whole script.
+	if line_limit is not None and len(base_lines) + len(script_lines) > line_limit:
+		return None
+	matcher = difflib.SequenceMatcher(None, base_lines, script_lines)
+	return [(head + i1, head + i2, script_lines[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+def script_patch(base, delta):
+	lines = base.split('\n')
+	for start, end, replacement in reversed(delta):
+		lines[start:end] = replacement
+	return '\n'.join(lines)
+
+class FrameCodec(object):
+	raw_limit = 256
+	dictionary_limit = 65536
+	levels = ((4096, 9), (1048576, 6), (None, 1))
+
+	def __init__(self, dictionary=FRAME_DICTIONARY):
+		super(FrameCodec, self).__init__()
+		self.dictionary = dictionary
+		self.compressors = dict()
+		self.decompressor = None
+		return
+
+	@staticmethod
+	def dictionary_id(dictionary):
+		return zlib.adler32(dictionary) & 0xFFFFFFFF if dictionary else None
+
+	def level(self, size):
+		for limit, level in self.levels:
+			if limit is None or size <= limit:
+				return level
+		return zlib.Z_DEFAULT_COMPRESSION
+
+	def primed_compressor(self, level):
+		if level not in self.compressors:
+			compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+			compressor.compress(self.dictionary)
+			compressor.flush(zlib.Z_SYNC_FLUSH)
+			self.compressors[level] = compressor
+		return self.compressors[level].copy()
+
+	def primed_decompressor(self):
+		if self.decompressor is None:
+			compressor = zlib.compressobj(zlib.Z_BEST_SPEED, zlib.DEFLATED, -zlib.MAX_WBITS)
+			decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+			decompressor.decompress(compressor.compress(self.dictionary) + compressor.flush(zlib.Z_SYNC_FLUSH))
+			self.decompressor = decompressor
+		return self.decompressor.copy()
+
+	def encode(self, data):
+		size = len(data)
+		if size < self.raw_limit:
+			return struct.pack('B', FRAME_RAW) + data
+		level = self.level(size)
+		if self.dictionary and size <= self.dictionary_limit:
+			compressor = self.primed_compressor(level)
+			flag, body = FRAME_ZLIB_DICTIONARY, compressor.compress(data) + compressor.flush()
+		else:
+			flag, body = FRAME_ZLIB, zlib.compress(data, level)
+		if len(body) >= size:
+			flag, body = FRAME_RAW, data
+		return struct.pack('B', flag) + body
+
+	def decode(self, binary_data):
+		flag = bytearray(binary_data[:1])[0]
+		# Legacy frames are plain zlib streams, whose first byte always has deflate method 8 in the low nibble.
+		if flag & 0x0F == 0x08:
+			return zlib.decompress(binary_data)
+		body = binary_data[1:]
+		if flag == FRAME_RAW:
+			return body
+		if flag == FRAME_ZLIB:
+			return zlib.decompress(body)
+		if flag == FRAME_ZLIB_DICTIONARY:
+			if not self.dictionary:
+				raise ValueError('Frame compressed with dictionary, but no dictionary is set.')
+			decompressor = self.primed_decompressor()
+			return decompressor.decompress(body) + decompressor.flush()
+		raise ValueError('Unknown frame flag {0:#04x}.'.format(flag))
@@ -0,0 +1,179 @@
+# *************************
+# Python
+# *************************
+import time
+import heapq
+import itertools
+import threading
+import collections
+
+# *************************
+# Package
+# *************************
+from .metrics import LatencyHistogram
+
+clock = getattr(time, 'monotonic', time.time)
+
+class ExecutionScheduler(object):
+	def __init__(self, tick_hook=None, tick_budget=0.005, tick_interval=0.0, history_size=64):
+		super(ExecutionScheduler, self).__init__()
+		# tick_hook(delay, callback) has BigWorld.callback signature, without hook tasks run on submitting thread.
+		self.tick_hook = tick_hook
+		self.tick_budget = tick_budget
+		self.tick_interval = tick_interval
+		self.lock = threading.Lock()
+		self.queue = collections.deque()
+		self.background = collections.deque()
+		self.history = collections.deque(maxlen=history_size)
+		self.running = False
+		self.executed = 0
+		self.wait_time = 0.0
+		self.run_time = 0.0
+		self.wait_histogram = LatencyHistogram()
+		self.run_histogram = LatencyHistogram()
+		return
+
+	def start(self):
+		if self.tick_hook is not None and not self.running:
+			self.running = True
+			self.tick_hook(self.tick_interval, self.tick)
+		return
+
+	def stop(self):
+		self.running = False
+		return
+
+	def submit(self, name, function, *args):
+		submitted = clock()
+		if self.tick_hook is None:
+			return self.execute(name, function, args, submitted)
+		self.lock.acquire()
+		self.queue.append((name, function, args, submitted))
+		self.lock.release()
+		return None
+
+	def submit_background(self, function):
+		# function() does one short step of work and returns True while more is left, steps use time scripts left over.
+		if self.tick_hook is None:
+			while function():
+				pass
+			return
+		self.lock.acquire()
+		if function not in self.background:
+			self.background.append(function)
+		self.lock.release()
+		return
+
+	def execute(self, name, function, args, submitted):
+		started = clock()
+		try:
+			return function(*args)
+		finally:
+			finished = clock()
+			self.lock.acquire()
+			self.history.append((name, started - submitted, finished - started))
+			self.executed += 1
+			self.wait_time += started - submitted
+			self.run_time += finished - started
+			self.wait_histogram.add(started - submitted)
+			self.run_histogram.add(finished - started)
+			self.lock.release()
+		return
+
+	def run_pending(self, budget=None):
+		deadline = clock() + budget if budget is not None else None
+		while True:
+			self.lock.acquire()
+			try:
+				if not self.queue:
+					break
+				name, function, args, submitted = self.queue.popleft()
+			finally:
+				self.lock.release()
+			try:
+				self.execute(name, function, args, submitted)
+			except:
+				pass
+			# A running script can not be preempted, budget only limits how many scripts are started per tick.
+			if deadline is not None and clock() >= deadline:
+				return
+		while deadline is None or clock() < deadline:
+			self.lock.acquire()
+			try:
+				if not self.background:
+					break
+				function = self.background.popleft()
+			finally:
+				self.lock.release()
+			try:
+				more = function()
+			except:
+				more = False
+			if more:
+				self.lock.acquire()
+				if function not in self.background:
+					self.background.append(function)
+				self.lock.release()
+		return
+
+	def pending(self):
+		return len(self.queue)
+
+	def stats(self):
+		return {
+			'executed': self.executed,
+			'pending': self.pending(),
+			'wait': self.wait_histogram.snapshot(),
+			'run': self.run_histogram.snapshot()
+		}
+
+	def tick(self):
+		if not self.running:
+			return
+		try:
+			self.run_pending(self.tick_budget)
+		finally:
+			if self.running:
+				self.tick_hook(self.tick_interval, self.tick)
+		return
+
+class TickLoop(object):
+	frame_interval = 0.01
+
+	def __init__(self):
+		super(TickLoop, self).__init__()
+		self.lock = threading.Lock()
+		self.calls = list()
+		self.counter = itertools.count()
+		self.running = False
+		return
+
+	def callback(self, delay, function):
+		self.lock.acquire()
+		heapq.heappush(self.calls, (clock() + delay, next(self.counter), function))
+		self.lock.release()
+		return
+
+	def run(self):
+		self.running = True
+		while self.running:
+			frame_start = clock()
+			due = list()
+			self.lock.acquire()
+			while self.calls and self.calls[0][0] <= frame_start:
+				due.append(heapq.heappop(self.calls)[2])
+			self.lock.release()
+			for function in due:
+				function()
+			time.sleep(max(self.frame_interval - (clock() - frame_start), 0.0))
+		return
+
+	def start(self):
+		thread = threading.Thread(target=self.run, name='TickLoop')
+		thread.daemon = True
+		thread.start()
+		return thread
+
+	def stop(self):
+		self.running = False
+		return
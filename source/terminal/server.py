@@ -1,27 +1,66 @@
 # *************************
 # Python
 # *************************
-import io
 import sys
+import time
 import zlib
 import types
+import random
 import marshal
 import functools
-import linecache
 import threading
 import traceback
+import collections
 
 # *************************
 # Package
 # *************************
+from .logs import LogRecordWriter, LogRingBuffer, LogSubscription
+from .cache import CodeCache, ScriptLineCache
+from .sessions import SessionStore
+from .metrics import LatencyHistogram, timer, stats_format
+from .profiler import ScriptProfiler, SamplingProfiler
+from .scheduler import ExecutionScheduler
+from .protocol import STREAM_STDOUT, STREAM_STDERR, STREAM_BWLOG, LOG_LEVELS, MESSAGE_LOGS, MESSAGE_SCRIPT_MISS, MESSAGE_HELLO, message_dumps
+from .protocol import MESSAGE_LOG_COMPRESSION, MESSAGE_PROFILE, MESSAGE_SAMPLES, MESSAGE_STATS
+from .protocol import FRAME_RAW, FRAME_ZLIB, FRAME_ZLIB_DICTIONARY, FrameCodec
+from .protocol import REQUEST_SCRIPT, REQUEST_SCRIPT_HASH, REQUEST_SCRIPT_DROP, REQUEST_SCRIPT_DELTA
+from .protocol import script_digest, script_patch
 from .sockets import TCPStreamServer, TCPStreamHandler, TCPStreamIO, TCPFrameIO
 
+text_type = type(u'')
+
+def log_text(value, encoding):
+	if isinstance(value, text_type):
+		return value
+	if isinstance(value, bytes):
+		return value.decode(encoding, 'replace')
+	return u'{0}'.format(value)
+
+class TeeSink(object):
+	__slots__ = ('stream', 'write', 'text')
+
+	def __init__(self, stream):
+		super(TeeSink, self).__init__()
+		self.stream = stream
+		self.write = stream.write
+		# None until the first write tells whether the sink takes text or native bytes.
+		self.text = None
+		return
+
 class StreamTee(object):
-	def __init__(self, target, streams=None):
+	# Only every Nth write is timed, two timer calls per print would cost more than the fan-out itself.
+	fanout_sample_rate = 64
+
+	def __init__(self, target):
 		super(StreamTee, self).__init__()
 		self.target = target
 		self.lock = threading.Lock()
-		self.streams = streams if streams is not None else set()
+		# Writers iterate an immutable snapshot, add and discard replace it under the lock.
+		self.streams = ()
+		self.writes = 0
+		self.written = 0
+		self.fanout = LatencyHistogram()
 		return
 
 	def install(self, object, property, checkTypes=True):
@@ -36,46 +75,87 @@ class StreamTee(object):
 		setattr(object, property, self.target)
 		return
 
-	def add(self, stream):
+	def add(self, stream, first=False):
 		self.lock.acquire()
-		self.streams.add(stream)
+		if all(sink.stream is not stream for sink in self.streams):
+			self.streams = (TeeSink(stream), ) + self.streams if first else self.streams + (TeeSink(stream), )
 		self.lock.release()
 		return
 
 	def discard(self, stream):
 		self.lock.acquire()
-		self.streams.discard(stream)
+		self.streams = tuple(sink for sink in self.streams if sink.stream is not stream)
 		self.lock.release()
 		return
 
+	def sinks(self):
+		return [sink.stream for sink in self.streams]
+
 	def __getattr__(self, name):
 		result = getattr(self.target, name)
 		if hasattr(result, '__call__'):
-			return functools.partial(self.__callmethod__, name)
+			# Cache the dispatcher on the instance so later lookups skip __getattr__.
+			result = functools.partial(self.__callmethod__, name)
+			setattr(self, name, result)
+		return result
+
+	def stats(self):
+		return {'sinks': len(self.streams), 'writes': self.writes, 'written': self.written, 'fanout': self.fanout.snapshot()}
+
+	def convert(self, value, text):
+		encoding = getattr(self.target, 'encoding', None) or 'utf-8'
+		if text and isinstance(value, bytes):
+			return value.decode(encoding, 'replace')
+		if not text and isinstance(value, text_type):
+			return value.encode(encoding, 'replace')
+		return value
+
+	def report(self):
+		self.target.write('-' * 40 + '\n')
+		self.target.write(traceback.format_exc())
+		self.target.write('-' * 40 + '\n')
+		return
+
+	def write(self, string, skipTarget=False, **kwargs):
+		result = self.target.write(string) if not skipTarget else None
+		self.writes += 1
+		self.written += len(string)
+		started = timer() if not self.writes % self.fanout_sample_rate else None
+		is_text = isinstance(string, text_type)
+		converted = None
+		for sink in self.streams:
+			try:
+				if sink.text is None:
+					try:
+						sink.write(string, **kwargs)
+						sink.text = is_text
+						continue
+					except TypeError:
+						sink.text = not is_text
+				if sink.text is is_text:
+					sink.write(string, **kwargs)
+				else:
+					# Converted once per write and shared by all sinks of the other kind.
+					if converted is None:
+						converted = self.convert(string, sink.text)
+					sink.write(converted, **kwargs)
+			except:
+				self.report()
+		if started is not None:
+			self.fanout.add(timer() - started)
 		return result
 
 	def __callmethod__(self, name, *args, **kwargs):
 		result = getattr(self.target, name)(*args, **kwargs) if not kwargs.pop('skipTarget', False) else None
-		self.lock.acquire()
-		for stream in self.streams:
+		for sink in self.streams:
 			try:
-				getattr(stream, name)(*args, **kwargs)
-			except TypeError:
-				try:
-					target_encoding = getattr(self.target, 'encoding', sys.getdefaultencoding())
-					getattr(stream, name)(
-						*[unicode(item, encoding=target_encoding) for item in args],
-						**{key: unicode(value, encoding=target_encoding) for key, value in kwargs.items()}
-					)
-				except:
-					self.target.write('-' * 40 + '\n')
-					self.target.write(traceback.format_exc())
-					self.target.write('-' * 40 + '\n')
+				method = getattr(sink.stream, name)
+				if sink.text is None:
+					method(*args, **kwargs)
+				else:
+					method(*[self.convert(item, sink.text) for item in args], **dict((key, self.convert(value, sink.text)) for key, value in kwargs.items()))
 			except:
-				self.target.write('-' * 40 + '\n')
-				self.target.write(traceback.format_exc())
-				self.target.write('-' * 40 + '\n')
-		self.lock.release()
+				self.report()
 		return result
 
 	def __del__(self):
@@ -84,27 +164,120 @@ class StreamTee(object):
 class TerminalServer(TCPStreamServer):
 	allow_reuse_address = True
 	daemon_threads = True
+	log_capacity = 16384
+	log_size_limit = 4194304
+	code_cache_count = 256
+	code_cache_size = 16777216
+	line_cache_count = 256
+	line_cache_size = 8388608
+	session_count = 64
+	session_size_limit = 268435456
+	session_ttl = 3600.0
+	session_snapshots = True
+	session_path = None
+	tick_budget = 0.005
+	tick_interval = 0.0
+	log_buffer_levels = None
+
+	def __init__(self, server_address, handler_class, server_mode=None, tick_hook=None):
+		super(TerminalServer, self).__init__(server_address, handler_class, server_mode)
+		self.tick_hook = tick_hook
+		self.log_levels = frozenset()
+		self.log_buffered = frozenset()
+		self.clients = set()
+		self.clients_total = 0
+		self.started = time.time()
+		return
+
+	def stats(self):
+		return {
+			'server': {'mode': self.server_mode, 'uptime': round(time.time() - self.started, 1), 'clients': len(self.clients), 'clients_total': self.clients_total},
+			'scheduler': self.scheduler.stats(),
+			'sessions': self.sessions.stats(),
+			'code_cache': self.code_cache.stats(),
+			'line_cache': self.line_cache.stats(),
+			'log_buffer': self.buffer.stats(),
+			'tees': {'stdout': self.outtee.stats(), 'stderr': self.errtee.stats(), 'bwlog': self.logtee.stats()},
+			'clients': dict(('{0[0]}:{0[1]}'.format(handler.client_address), handler.stats()) for handler in list(self.clients))
+		}
+
+	def log_hook(self, level, origin):
+		def hook(prefix, msg, *args, **kwargs):
+			# Message is formatted only when some client wants the level, the buffer keeps it raw until fetched.
+			if level in self.log_levels:
+				self.log_record(level, prefix, msg)
+			if level in self.log_buffered:
+				self.buffer.capture((STREAM_BWLOG, (prefix, msg), level))
+			return origin(prefix, msg, *args, **kwargs)
+		return hook
+
+	def log_format(self, prefix, msg):
+		encoding = getattr(self.logtee.target, 'encoding', None) or 'utf-8'
+		return u'[{0}] {1}\n'.format(log_text(prefix, encoding), log_text(msg, encoding))
+
+	def log_record(self, level, prefix, msg):
+		self.logtee.write(self.log_format(prefix, msg), skipTarget=True, level=level)
+		return
+
+	def log_levels_update(self):
+		levels = set()
+		for stream in self.logtee.sinks():
+			subscription = getattr(stream, 'subscription', None)
+			levels.update(subscription.stream_levels(STREAM_BWLOG) if subscription is not None else LOG_LEVELS)
+		self.log_levels = frozenset(levels)
+		return
+
+	def log_buffer_subscribe(self, levels=None):
+		self.log_buffered = frozenset(level.upper() for level in levels) if levels is not None else LOG_LEVELS
+		return
 
 	def setup(self):
-		self.locals = dict()
-		self.buffer = io.StringIO()
+		self.scheduler = ExecutionScheduler(self.tick_hook, self.tick_budget, self.tick_interval)
+		self.scheduler.start()
+		self.sessions = SessionStore(self.session_count, self.session_size_limit, self.session_ttl, self.session_snapshots, path=self.session_path, scheduler=self.scheduler)
+		self.sampler = SamplingProfiler()
+		self.code_cache = CodeCache(self.code_cache_count, self.code_cache_size)
+		self.line_cache = ScriptLineCache(self.line_cache_count, self.line_cache_size)
+		self.codec = FrameCodec()
+		self.log_cursors = dict()
+		self.buffer = LogRingBuffer(self.log_capacity, self.log_size_limit)
+		# Clients keep (epoch, sequence) cursors, a new epoch tells them the buffer was recreated.
+		self.log_epoch = random.getrandbits(31)
 		self.outtee = StreamTee(sys.stdout)
 		self.errtee = StreamTee(sys.stderr)
-		self.outtee.add(self.buffer)
-		self.errtee.add(self.buffer)
+		self.logtee = StreamTee(sys.stderr)
+		self.tees = {STREAM_STDOUT: self.outtee, STREAM_STDERR: self.errtee, STREAM_BWLOG: self.logtee}
+		# BigWorld records reach the buffer straight from log_hook, unformatted.
+		self.outtee.add(self.buffer.writer(STREAM_STDOUT))
+		self.errtee.add(self.buffer.writer(STREAM_STDERR))
 		self.outtee.install(sys, 'stdout', False)
 		self.errtee.install(sys, 'stderr', False)
+		self.log_buffer_subscribe(self.log_buffer_levels)
 		return
 
 	def cleanup(self):
+		self.log_levels = frozenset()
+		self.log_buffered = frozenset()
 		self.outtee.remove(sys, 'stdout', True)
 		self.errtee.remove(sys, 'stderr', True)
-		self.outtee.discard(self.buffer)
-		self.errtee.discard(self.buffer)
+		for stream_id, tee in self.tees.items():
+			tee.discard(self.buffer.writer(stream_id))
+		self.tees = None
 		self.outtee = None
 		self.errtee = None
+		self.logtee = None
 		self.buffer = None
-		self.locals = None
+		self.log_cursors = None
+		self.code_cache = None
+		self.line_cache.clear()
+		self.line_cache = None
+		self.codec = None
+		self.scheduler.stop()
+		self.scheduler = None
+		self.sampler.stop()
+		self.sampler = None
+		self.sessions.close()
+		self.sessions = None
 		return
 
 	def launch(self):
@@ -135,26 +308,310 @@ class TerminalLocals(dict):
 		return self.builtins[key]
 
 class TerminalHandler(TCPStreamHandler, TCPStreamIO, TCPFrameIO):
+	script_version_limit = 64
 	encoding = 'utf-8'
+	disable_nagle_algorithm = True
+	send_queued = True
+	send_queue_limit = 8388608
+	send_queue_policy = 'drop_oldest'
+	send_coalesce_delay = 0.005
+	send_coalesce_size = 65536
 
 	def service_update_locals(self, uuid):
-		self.locals, self.locals.builtins = self.server.locals.setdefault(uuid, self.locals), self.locals.builtins
+		if self.uuid is not None:
+			self.server.sessions.detach(self.uuid)
+		self.locals, self.locals.builtins = self.server.sessions.attach(uuid, self.locals), self.locals.builtins
+		self.uuid = uuid
+		return
+
+	def service_fetch_logs(self, since=None, epoch=None):
+		# Cursor left at disconnect is only a fallback for clients that lost their own.
+		if since is None or (epoch is not None and epoch != self.server.log_epoch):
+			since = self.server.log_cursors.get(self.uuid, 0)
+		evicted, records = self.server.buffer.fetch(since, self.log_attach_seq)
+		if evicted:
+			gap = self.server.buffer.gap_format.format(evicted)
+			self.wfile.enqueue((STREAM_STDERR, gap), len(gap))
+		for stream_id, string, level in records:
+			if isinstance(string, tuple):
+				string = self.server.log_format(*string)
+			self.writers[stream_id].write(string, level)
+		self.send_message(MESSAGE_LOGS, ((self.server.log_epoch, self.log_attach_seq), []))
+		return
+
+	def service_log_subscribe(self, streams=None, levels=None, pattern=None, prefixes=None):
+		subscription = None
+		if streams is not None or levels is not None or pattern or prefixes:
+			subscription = LogSubscription(streams, levels, pattern, prefixes)
+		for writer in self.writers.values():
+			writer.subscription = subscription
+		self.server.log_levels_update()
 		return
 
-	def service_fetch_logs(self):
-		self.writer.write(self.server.buffer.getvalue())
+	def service_log_coalescing(self, delay=None, size=None):
+		self.wfile.coalesce(delay, size)
 		return
 
+	def service_profile_next(self, top=25, raw=False, digest=None):
+		self.profile_options = digest, top, raw
+		return
+
+	def service_sampling_start(self, interval=0.005):
+		self.server.sampler.start(interval)
+		return
+
+	def service_sampling_stop(self):
+		self.server.sampler.stop()
+		return
+
+	def service_sampling_clear(self):
+		self.server.sampler.clear()
+		return
+
+	def service_sampling_fetch(self, offset=0, size=262144):
+		if offset == 0 or self.samples_snapshot is None:
+			self.samples_snapshot = self.server.sampler.collapsed()
+		chunk = self.samples_snapshot[offset:offset + size]
+		self.send_message(MESSAGE_SAMPLES, (offset, len(self.samples_snapshot), chunk))
+		if offset + len(chunk) >= len(self.samples_snapshot):
+			self.samples_snapshot = None
+		return
+
+	def service_stats(self, report=False):
+		stats = self.server.stats()
+		if report:
+			self.send_message(MESSAGE_STATS, stats_format(stats))
+		return stats
+
+	def service_script_timings(self, count=10):
+		history = list(self.server.scheduler.history)[-count:]
+		for name, wait_time, run_time in history:
+			sys.stdout.write('{0:>9.3f} ms wait {1:>9.3f} ms run  {2}\n'.format(wait_time * 1000.0, run_time * 1000.0, name))
+		return
+
+	def service_log_compression(self, level=6):
+		if self.log_compression_marker is None and self.log_compressor is None:
+			binary_data = message_dumps(MESSAGE_LOG_COMPRESSION, level)
+			self.log_compression_level = level
+			self.log_compression_marker = binary_data
+			self.wfile.enqueue(binary_data, len(binary_data), False)
+			self.wfile.flush()
+		return
+
+	def message_encode(self, binary_data):
+		if self.log_compressor is not None:
+			binary_data = self.log_compressor.compress(binary_data) + self.log_compressor.flush(zlib.Z_SYNC_FLUSH)
+		return self.frame_encode(binary_data)
+
+	def send_prepare(self):
+		# Client queues are written before the buffer, so everything below this sequence is queued by now.
+		self.log_sequence = self.server.buffer.sequence()
+		return
+
+	def send_encode(self, items):
+		buffers = list()
+		records = list()
+		cursor = (self.server.log_epoch, self.log_sequence)
+		for item in items:
+			if isinstance(item, tuple):
+				records.append(item)
+				continue
+			if records:
+				buffers.extend(self.message_encode(message_dumps(MESSAGE_LOGS, (cursor, records))))
+				records = list()
+			buffers.extend(self.message_encode(item))
+			# Everything queued after the acknowledgement is part of the compressed stream.
+			if item is self.log_compression_marker:
+				self.log_compressor = zlib.compressobj(self.log_compression_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+				self.log_compression_marker = None
+		if records:
+			buffers.extend(self.message_encode(message_dumps(MESSAGE_LOGS, (cursor, records))))
+		return buffers
+
 	def request_intro(self):
-		self.stream_files_create()
-		self.writer = io.TextIOWrapper(io.BufferedWriter(self.wfile, buffer_size=1), encoding=self.encoding, line_buffering=True)
-		self.server.outtee.add(self.writer)
-		self.server.errtee.add(self.writer)
+		self.log_compressor = None
+		self.log_compression_level = None
+		self.log_compression_marker = None
+		self.log_sequence = self.server.buffer.sequence()
+		self.send_stats = 0, 0, 0, False
+		self.stream_files_create(self.server.reactor_notify())
+		self.send_message(MESSAGE_HELLO, ((FRAME_RAW, FRAME_ZLIB, FRAME_ZLIB_DICTIONARY), FrameCodec.dictionary_id(self.server.codec.dictionary)))
+		self.writers = dict((stream_id, LogRecordWriter(self.wfile, stream_id)) for stream_id in self.server.tees)
+		for stream_id, tee in self.server.tees.items():
+			tee.add(self.writers[stream_id], True)
+		self.server.log_levels_update()
+		self.log_attach_seq = self.server.buffer.sequence()
+		self.uuid = None
+		self.script_awaiting = None
+		self.script_deferred = list()
+		self.script_versions = collections.OrderedDict()
+		self.profile_options = None
+		self.samples_snapshot = None
+		self.frames_received = 0
+		self.bytes_received = 0
+		self.request_latency = LatencyHistogram()
+		self.server.clients.add(self)
+		self.server.clients_total += 1
 		self.locals = TerminalLocals()
 		self.locals.builtins = {
 			'update_locals': self.service_update_locals,
-			'fetch_logs': self.service_fetch_logs
+			'fetch_logs': self.service_fetch_logs,
+			'log_coalescing': self.service_log_coalescing,
+			'log_compression': self.service_log_compression,
+			'log_subscribe': self.service_log_subscribe,
+			'script_timings': self.service_script_timings,
+			'profile_next': self.service_profile_next,
+			'sampling_start': self.service_sampling_start,
+			'sampling_stop': self.service_sampling_stop,
+			'sampling_clear': self.service_sampling_clear,
+			'sampling_fetch': self.service_sampling_fetch,
+			'stats': self.service_stats
+		}
+		return
+
+	def send_message(self, message_type, data):
+		wfile = self.wfile
+		if wfile is None:
+			return
+		binary_data = message_dumps(message_type, data)
+		wfile.enqueue(binary_data, len(binary_data), False)
+		wfile.flush()
+		return
+
+	def script_error(self):
+		try:
+			exc_type, exc_value, exc_traceback = sys.exc_info()
+			sys.stderr.write(''.join(traceback.format_exception(exc_type, exc_value, exc_traceback.tb_next)).join(['-' * 40 + '\n'] * 2))
+		finally:
+			exc_type = exc_value = exc_traceback = None
+		return
+
+	def script_compile(self, filename, script, digest):
+		try:
+			return self.server.code_cache.add(digest, compile(script, filename.encode(errors='ignore'), 'exec'), script)
+		except:
+			self.script_error()
+		return None
+
+	def script_exec(self, code, namespace):
+		try:
+			exec(code, namespace)
+		except:
+			self.script_error()
+		return
+
+	def script_profile(self, code, digest):
+		namespace = self.locals
+		# Scripts still queued when the client disconnected are dropped, their namespace is gone.
+		if namespace is None:
+			return
+		profile_options = self.profile_options
+		# Options without a digest apply to the next script, a failed compile (code None) consumes them too.
+		if profile_options is not None and profile_options[0] in (None, digest):
+			self.profile_options = None
+		else:
+			profile_options = None
+		if code is None:
+			return
+		if profile_options is None:
+			return self.script_exec(code, namespace)
+		profiler = ScriptProfiler(*profile_options[1:])
+		profiler.run(self.script_exec, code, namespace)
+		self.send_message(MESSAGE_PROFILE, profiler.result(code.co_filename))
+		return
+
+	def script_execute(self, filename, code, digest):
+		name = code.co_filename if code is not None else filename.encode(errors='ignore')
+		self.server.scheduler.submit(name, self.script_profile, code, digest)
+		return
+
+	def request_resumes(self, request_type, data):
+		if request_type == REQUEST_SCRIPT:
+			return script_digest(*data) == self.script_awaiting
+		return request_type == REQUEST_SCRIPT_DROP and data == self.script_awaiting
+
+	def script_missing(self, digest):
+		self.script_awaiting = digest
+		self.send_message(MESSAGE_SCRIPT_MISS, digest)
+		return
+
+	def script_run(self, filename, script, digest):
+		if digest == self.script_awaiting:
+			self.script_awaiting = None
+		self.script_versions.pop(filename, None)
+		self.script_versions[filename] = digest, script
+		while len(self.script_versions) > self.script_version_limit:
+			self.script_versions.popitem(last=False)
+		code = self.server.code_cache.get(digest)
+		if code is None or not self.server.line_cache.touch(filename, digest):
+			self.server.line_cache.add(filename, script, digest)
+		if code is None:
+			code = self.script_compile(filename, script, digest)
+		# Queued even when compiling failed, so profile options armed for this script are dropped in order.
+		self.script_execute(filename, code, digest)
+		return
+
+	def request_dispatch(self, request_type, data):
+		if request_type == REQUEST_SCRIPT:
+			filename, script = data
+			self.script_run(filename, script, script_digest(filename, script))
+		elif request_type == REQUEST_SCRIPT_HASH:
+			filename, digest = data
+			code = self.server.code_cache.get(digest)
+			if code is None or not self.server.line_cache.touch(filename, digest):
+				self.script_missing(digest)
+				return
+			self.script_execute(filename, code, digest)
+		elif request_type == REQUEST_SCRIPT_DELTA:
+			filename, base_digest, digest, delta = data
+			base_digest_known, base = self.script_versions.get(filename, (None, None))
+			script = script_patch(base, delta) if base_digest_known == base_digest else None
+			if script is None or script_digest(filename, script) != digest:
+				self.script_missing(digest)
+				return
+			self.script_run(filename, script, digest)
+		elif request_type == REQUEST_SCRIPT_DROP:
+			if data == self.script_awaiting:
+				self.script_awaiting = None
+		return
+
+	def stats(self):
+		# Outro clears wfile on the handler thread, the last counters read stay reported.
+		wfile = self.wfile
+		if wfile is not None:
+			self.send_stats = wfile.sent_bytes, wfile.queued_bytes, wfile.dropped_bytes, wfile.overflowed
+		bytes_sent, bytes_queued, bytes_dropped, overflowed = self.send_stats
+		return {
+			'uuid': self.uuid,
+			'frames_received': self.frames_received,
+			'bytes_received': self.bytes_received,
+			'bytes_sent': bytes_sent,
+			'bytes_queued': bytes_queued,
+			'bytes_dropped': bytes_dropped,
+			'overflowed': overflowed,
+			'requests': self.request_latency.snapshot()
 		}
+
+	def request_frame(self, binary_data):
+		started = timer()
+		try:
+			self.request_frame_process(binary_data)
+		finally:
+			self.frames_received += 1
+			self.bytes_received += len(binary_data)
+			self.request_latency.add(timer() - started)
+		return
+
+	def request_frame_process(self, binary_data):
+		request = marshal.loads(self.server.codec.decode(binary_data))
+		if not isinstance(request[0], int):
+			request = REQUEST_SCRIPT, request
+		if self.script_awaiting is not None and not self.request_resumes(*request):
+			self.script_deferred.append(request)
+			return
+		self.request_dispatch(*request)
+		while self.script_awaiting is None and self.script_deferred:
+			self.request_dispatch(*self.script_deferred.pop(0))
 		return
 
 	def request_serve(self):
@@ -162,24 +619,37 @@ class TerminalHandler(TCPStreamHandler, TCPStreamIO, TCPFrameIO):
 			binary_data = self.recv_frame()
 			if not binary_data:
 				break
-			filename, script = marshal.loads(zlib.decompress(binary_data))
-			linecache.cache[filename] = None, None, list(map(lambda line: line + '\n', script.split('\n'))), None
-			try:
-				exec(compile(script, filename.encode(errors='ignore'), 'exec'), self.locals)
-			except:
-				try:
-					exc_type, exc_value, exc_traceback = sys.exc_info()
-					sys.stderr.write(''.join(traceback.format_exception(exc_type, exc_value, exc_traceback.tb_next)).join(['-' * 40 + '\n'] * 2))
-				finally:
-					exc_type = exc_value = exc_traceback = None
+			self.request_frame(binary_data)
 		return
 
+	def request_readable(self):
+		frames, alive = self.recv_frames_nowait()
+		for binary_data in frames:
+			self.request_frame(binary_data)
+		return alive
+
+	def request_writable(self):
+		self.wfile.send_pending()
+		return not self.wfile.overflowed
+
+	def request_pending(self):
+		return self.wfile.pending()
+
+	def request_deadline(self):
+		return self.wfile.deadline()
+
 	def request_outro(self):
+		self.server.clients.discard(self)
+		if self.uuid is not None:
+			self.server.log_cursors[self.uuid] = self.log_sequence
 		self.locals.builtins = None
+		if self.uuid is not None:
+			self.server.sessions.detach(self.uuid)
 		self.locals = None
-		self.server.outtee.discard(self.writer)
-		self.server.errtee.discard(self.writer)
-		self.writer = None
+		for stream_id, tee in self.server.tees.items():
+			tee.discard(self.writers[stream_id])
+		self.server.log_levels_update()
+		self.writers = None
 		self.stream_files_remove()
 		return
 
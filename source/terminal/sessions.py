@@ -0,0 +1,315 @@
+# *************************
+# Python
+# *************************
+import os
+import sys
+import time
+import types
+import shutil
+import hashlib
+import tempfile
+import threading
+import collections
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+# *************************
+# Package
+# *************************
+# Nothing
+
+clock = getattr(time, 'monotonic', time.time)
+
+# Code and modules are shared with the game or recreated by scripts, they are neither measured nor snapshotted.
+shared_types = (types.ModuleType, type, getattr(types, 'ClassType', type), types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+def namespace_variables(namespace):
+	return [(key, value) for key, value in list(namespace.items()) if not key.startswith('__') and not isinstance(value, shared_types)]
+
+def namespace_sizes(namespace, object_limit=65536, variable_limit=16384, step=512):
+	# Generator, yields None after every step values visited and (total, {name: size}) last, so measuring is spread over ticks.
+	seen = set()
+	sizes = dict()
+	total = 0
+	visited = 0
+	# Small variables go first, one huge variable must not leave the rest unmeasured.
+	for key, value in sorted(namespace_variables(namespace), key=lambda variable: sys.getsizeof(variable[1], 0)):
+		if len(seen) >= object_limit:
+			break
+		pending = [value]
+		size = 0
+		walked = 0
+		while pending and walked < variable_limit and len(seen) < object_limit:
+			visited += 1
+			if not visited % step:
+				yield None
+			value = pending.pop()
+			if id(value) in seen or isinstance(value, shared_types):
+				continue
+			seen.add(id(value))
+			walked += 1
+			size += sys.getsizeof(value, 0)
+			if isinstance(value, dict):
+				pending.extend(list(value.keys()))
+				pending.extend(list(value.values()))
+			elif isinstance(value, (list, tuple, set, frozenset, collections.deque)):
+				pending.extend(list(value))
+			elif hasattr(value, '__dict__'):
+				pending.append(value.__dict__)
+		total += size
+		# Variables cut off by a limit count towards the session size but are never snapshotted.
+		if not pending:
+			sizes[key] = size
+	yield total, sizes
+	return
+
+class Session(object):
+	__slots__ = ('namespace', 'size', 'sizes', 'touched', 'attached')
+
+	def __init__(self, namespace):
+		super(Session, self).__init__()
+		self.namespace = namespace
+		self.size = 0
+		self.sizes = dict()
+		self.touched = clock()
+		self.attached = 0
+		return
+
+class SessionStore(object):
+	def __init__(self, count_limit=64, size_limit=268435456, ttl=3600.0, snapshots=True, snapshot_limit=256, path=None, scheduler=None, snapshot_variable_size=1048576):
+		super(SessionStore, self).__init__()
+		self.count_limit = count_limit
+		self.size_limit = size_limit
+		self.ttl = ttl
+		self.snapshots = snapshots
+		self.snapshot_limit = snapshot_limit
+		# Each step pickles one variable, larger ones would stall the tick and are dropped on eviction.
+		self.snapshot_variable_size = snapshot_variable_size
+		self.path = path
+		self.path_owned = False
+		# Namespaces hold game objects, measuring and snapshots run as budgeted background steps of the scheduler.
+		self.scheduler = scheduler
+		self.lock = threading.Lock()
+		self.sessions = collections.OrderedDict()
+		self.snapshot_files = collections.OrderedDict()
+		self.measure_pending = list()
+		self.measuring = None
+		self.evicting = None
+		self.expiry_due = None
+		self.closed = False
+		self.evicted = 0
+		self.restored = 0
+		return
+
+	def wake(self):
+		# Called without the lock, without a scheduler all maintenance runs right here.
+		if self.scheduler is not None:
+			self.scheduler.submit_background(self.maintain)
+		else:
+			while self.maintain():
+				pass
+		return
+
+	def expire(self):
+		self.lock.acquire()
+		self.expiry_due = None
+		self.lock.release()
+		self.wake()
+		return
+
+	def expiry_schedule(self):
+		# Called with the lock held, one tick hook timer wakes maintenance when the oldest detached session expires.
+		tick_hook = getattr(self.scheduler, 'tick_hook', None)
+		if tick_hook is None or self.ttl is None or self.closed:
+			return
+		touched = [session.touched for session in self.sessions.values() if not session.attached]
+		if not touched:
+			return
+		due = min(touched) + self.ttl
+		if self.expiry_due is not None and self.expiry_due <= due:
+			return
+		self.expiry_due = due
+		tick_hook(max(due - clock(), 0.0), self.expire)
+		return
+
+	def attach(self, uuid, namespace):
+		path = None
+		self.lock.acquire()
+		try:
+			session = self.sessions.pop(uuid, None)
+			if session is None:
+				session = Session(namespace)
+				path = self.snapshot_files.pop(uuid, None)
+			session.attached += 1
+			session.touched = clock()
+			self.sessions[uuid] = session
+		finally:
+			self.lock.release()
+		if path is not None:
+			self.restore(path, session.namespace)
+		self.wake()
+		return session.namespace
+
+	def detach(self, uuid):
+		self.lock.acquire()
+		try:
+			session = self.sessions.get(uuid)
+			if session is None:
+				return
+			session.attached = max(session.attached - 1, 0)
+			session.touched = clock()
+			self.sessions[uuid] = self.sessions.pop(uuid)
+			self.measure_pending.append(session)
+		finally:
+			self.lock.release()
+		self.wake()
+		return
+
+	def maintain(self):
+		# One short step per call, returns True while work is left.
+		if self.measuring is not None:
+			session, sizer = self.measuring
+			result = next(sizer)
+			if result is not None:
+				session.size, session.sizes = result
+				self.measuring = None
+			return True
+		if self.evicting is not None:
+			return self.evict()
+		self.lock.acquire()
+		try:
+			if self.closed:
+				return False
+			if self.measure_pending:
+				session = self.measure_pending.pop(0)
+				self.measuring = session, namespace_sizes(session.namespace)
+				return True
+			victims = self.victims(clock())
+			if not victims:
+				self.expiry_schedule()
+				return False
+			uuid, session = victims[0]
+			path = self.snapshot_path(uuid) if self.snapshots else None
+			keys = [key for key, size in session.sizes.items() if size <= self.snapshot_variable_size] if path is not None else []
+			self.evicting = uuid, session, path, keys, dict()
+		finally:
+			self.lock.release()
+		return True
+
+	def evict(self):
+		uuid, session, path, keys, variables = self.evicting
+		if keys and not session.attached:
+			key = keys.pop()
+			try:
+				variables[key] = pickle.dumps(session.namespace[key], pickle.HIGHEST_PROTOCOL)
+			except Exception:
+				pass
+			return True
+		self.evicting = None
+		if path is not None and (session.attached or not variables or not self.snapshot(path, variables)):
+			path = None
+		self.lock.acquire()
+		try:
+			# Session could be attached again while it was pickled, then it stays.
+			if self.sessions.get(uuid) is session and not session.attached:
+				del self.sessions[uuid]
+				self.evicted += 1
+				if path is not None:
+					self.snapshot_files.pop(uuid, None)
+					self.snapshot_files[uuid] = path
+					while len(self.snapshot_files) > self.snapshot_limit:
+						self.snapshot_remove(self.snapshot_files.popitem(last=False)[1])
+			elif path is not None:
+				self.snapshot_remove(path)
+		finally:
+			self.lock.release()
+		return True
+
+	def victims(self, now):
+		victims = list()
+		count = len(self.sessions)
+		size = sum(session.size for session in self.sessions.values())
+		for uuid, session in self.sessions.items():
+			if session.attached:
+				continue
+			expired = self.ttl is not None and now - session.touched > self.ttl
+			# Sessions are ordered by last use, nothing past the first fresh one needs eviction.
+			if not expired and count <= self.count_limit and size <= self.size_limit:
+				break
+			victims.append((uuid, session))
+			count -= 1
+			size -= session.size
+		return victims
+
+	def snapshot_path(self, uuid):
+		if self.path is None:
+			self.path = tempfile.mkdtemp(prefix='WoTScriptTerminal-')
+			self.path_owned = True
+		name = hashlib.sha1(uuid if isinstance(uuid, bytes) else uuid.encode('utf-8')).hexdigest()
+		return os.path.join(self.path, '{0}.pickle'.format(name))
+
+	def snapshot(self, path, variables):
+		try:
+			with open(path, 'wb') as fobj:
+				pickle.dump(variables, fobj, pickle.HIGHEST_PROTOCOL)
+		except (IOError, OSError):
+			return False
+		return True
+
+	def restore(self, path, namespace):
+		try:
+			with open(path, 'rb') as fobj:
+				variables = pickle.load(fobj)
+		except Exception:
+			variables = dict()
+		self.snapshot_remove(path)
+		for key, binary_data in variables.items():
+			try:
+				namespace[key] = pickle.loads(binary_data)
+			except Exception:
+				pass
+		self.restored += 1
+		return True
+
+	@staticmethod
+	def snapshot_remove(path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+		return
+
+	def stats(self):
+		self.lock.acquire()
+		try:
+			return {
+				'sessions': len(self.sessions),
+				'attached': sum(1 for session in self.sessions.values() if session.attached),
+				'size': sum(session.size for session in self.sessions.values()),
+				'evicted': self.evicted,
+				'snapshots': len(self.snapshot_files),
+				'restored': self.restored
+			}
+		finally:
+			self.lock.release()
+		return
+
+	def close(self):
+		self.lock.acquire()
+		self.closed = True
+		self.sessions.clear()
+		self.measure_pending = list()
+		self.measuring = None
+		self.evicting = None
+		for path in self.snapshot_files.values():
+			self.snapshot_remove(path)
+		self.snapshot_files.clear()
+		if self.path_owned:
+			shutil.rmtree(self.path, True)
+			self.path = None
+			self.path_owned = False
+		self.lock.release()
+		return
@@ -11,11 +11,117 @@ import weakref
 import functools
 import threading
 import traceback
+import collections
+
+try:
+	import selectors
+except ImportError:
+	selectors = None
 
 # *************************
 # Package
 # *************************
-from .stream import SocketFileIO
+from .stream import SocketFileIO, SocketQueueIO
+
+EVENT_READ = 1
+EVENT_WRITE = 2
+
+if sys.version_info[0] < 3:
+	def frame_view(data, size):
+		return buffer(data, 0, size)
+else:
+	def frame_view(data, size):
+		return memoryview(data)[:size]
+
+SelectorKey = collections.namedtuple('SelectorKey', ('fileobj', 'fd', 'events', 'data'))
+
+class SelectSelector(object):
+	def __init__(self):
+		super(SelectSelector, self).__init__()
+		self.keys = dict()
+		return
+
+	def register(self, fileobj, events, data=None):
+		key = SelectorKey(fileobj, fileobj.fileno(), events, data)
+		if key.fd in self.keys:
+			raise KeyError('{0!r} is already registered.'.format(fileobj))
+		self.keys[key.fd] = key
+		return key
+
+	def unregister(self, fileobj):
+		return self.keys.pop(fileobj.fileno())
+
+	def modify(self, fileobj, events, data=None):
+		key = self.keys[fileobj.fileno()]._replace(events=events, data=data)
+		self.keys[key.fd] = key
+		return key
+
+	def select(self, timeout=None):
+		rlist = [fd for fd, key in self.keys.items() if key.events & EVENT_READ]
+		wlist = [fd for fd, key in self.keys.items() if key.events & EVENT_WRITE]
+		rlist, wlist, xlist = select.select(rlist, wlist, [], timeout)
+		rset, wset = set(rlist), set(wlist)
+		return [
+			(self.keys[fd], (EVENT_READ if fd in rset else 0) | (EVENT_WRITE if fd in wset else 0))
+			for fd in rset | wset if fd in self.keys
+		]
+
+	def close(self):
+		self.keys.clear()
+		return
+
+def create_selector():
+	return selectors.DefaultSelector() if selectors is not None else SelectSelector()
+
+class SocketWaker(object):
+	def __init__(self):
+		super(SocketWaker, self).__init__()
+		try:
+			self.rsocket, self.wsocket = socket.socketpair()
+		except (AttributeError, socket.error):
+			self.rsocket, self.wsocket = self.loopback_pair()
+		self.rsocket.setblocking(False)
+		self.wsocket.setblocking(False)
+		return
+
+	@staticmethod
+	def loopback_pair():
+		listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		try:
+			listener.bind(('127.0.0.1', 0))
+			listener.listen(1)
+			wsocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			wsocket.connect(listener.getsockname())
+			rsocket, address = listener.accept()
+		finally:
+			listener.close()
+		return rsocket, wsocket
+
+	def fileno(self):
+		return self.rsocket.fileno()
+
+	def wake(self):
+		try:
+			self.wsocket.send(b'\x00')
+		except socket.error:
+			pass
+		return
+
+	def drain(self):
+		try:
+			while self.rsocket.recv(4096):
+				pass
+		except socket.error:
+			pass
+		return
+
+	def close(self):
+		for sock in (self.rsocket, self.wsocket):
+			try:
+				sock.close()
+			except socket.error:
+				pass
+		return
 
 class ThreadCaller(object):
 	@staticmethod
@@ -35,6 +141,8 @@ class TCPStreamServer(ThreadCaller):
 	allow_reuse_address = False
 	request_queue_size = 5
 	daemon_threads = False
+	server_modes = ('threaded', 'reactor')
+	server_mode = 'threaded'
 
 	@staticmethod
 	def eintr_retry_call(func, *args, **kwargs):
@@ -46,11 +154,18 @@ class TCPStreamServer(ThreadCaller):
 					raise
 		return
 
-	def __init__(self, server_address, handler_class):
+	def __init__(self, server_address, handler_class, server_mode=None):
 		super(TCPStreamServer, self).__init__()
+		if server_mode is not None:
+			if server_mode not in self.server_modes:
+				raise ValueError('Unknown server mode {0!r}.'.format(server_mode))
+			self.server_mode = server_mode
 		self.server_address = server_address
 		self.handler_class = handler_class
 		self.socket = None
+		self.selector = None
+		self.waker = None
+		self.handlers = dict()
 		self.shutdown_requested = threading.Event()
 		self.shutdown_requested.clear()
 		self.shutdown_completed = threading.Event()
@@ -117,15 +232,106 @@ class TCPStreamServer(ThreadCaller):
 		try:
 			self.shutdown_requested.clear()
 			self.shutdown_completed.clear()
-			while not self.shutdown_requested.is_set():
-				rlist, wlist, xlist = self.eintr_retry_call(select.select, [self], [], [], poll_interval)
-				if self in rlist:
-					self.server_handle()
+			if self.server_mode == 'reactor':
+				self.reactor_loop(poll_interval)
+			else:
+				while not self.shutdown_requested.is_set():
+					rlist, wlist, xlist = self.eintr_retry_call(select.select, [self], [], [], poll_interval)
+					if self in rlist:
+						self.server_handle()
 		finally:
 			self.shutdown_requested.clear()
 			self.shutdown_completed.set()
 		return
 
+	def reactor_loop(self, poll_interval=0.5):
+		self.selector = create_selector()
+		self.waker = SocketWaker()
+		try:
+			self.selector.register(self, EVENT_READ, None)
+			self.selector.register(self.waker, EVENT_READ, self.waker)
+			while not self.shutdown_requested.is_set():
+				self.reactor_poll(poll_interval)
+		finally:
+			for handler in list(self.handlers.values()):
+				self.reactor_detach(handler)
+			self.selector.close()
+			self.selector = None
+			self.waker.close()
+			self.waker = None
+		return
+
+	def reactor_poll(self, poll_interval):
+		timeout = poll_interval
+		for handler, events in list(self.handlers.items()):
+			deadline = handler.request_deadline()
+			if deadline is not None:
+				timeout = min(timeout, deadline)
+			required = EVENT_READ | (EVENT_WRITE if deadline == 0.0 else 0)
+			if required != events:
+				self.selector.modify(handler, required, handler)
+				self.handlers[handler] = required
+		for key, events in self.eintr_retry_call(self.selector.select, timeout):
+			if key.data is None:
+				self.server_handle()
+			elif key.data is self.waker:
+				self.waker.drain()
+			elif key.data in self.handlers:
+				self.reactor_dispatch(key.data, events)
+		return
+
+	def reactor_notify(self):
+		return self.waker.wake if self.server_mode == 'reactor' and self.waker is not None else None
+
+	def reactor_attach(self, request, client_address):
+		try:
+			request.setblocking(False)
+			handler = self.handler_class(request, client_address, self)
+			handler.request_open()
+		except socket.error:
+			self.request_error(request, client_address)
+			self.request_shutdown(request)
+			return None
+		except:
+			self.handler_error(request, client_address)
+			self.request_shutdown(request)
+			return None
+		self.selector.register(handler, EVENT_READ, handler)
+		self.handlers[handler] = EVENT_READ
+		return handler
+
+	def reactor_dispatch(self, handler, events):
+		try:
+			alive = True
+			if events & EVENT_WRITE:
+				alive = handler.request_writable()
+			if alive and events & EVENT_READ:
+				alive = handler.request_readable()
+		except socket.error:
+			self.request_error(handler.socket, handler.client_address)
+			alive = False
+		except:
+			self.handler_error(handler.socket, handler.client_address)
+			alive = False
+		if not alive:
+			self.reactor_detach(handler)
+		return
+
+	def reactor_detach(self, handler):
+		request = handler.socket
+		self.handlers.pop(handler, None)
+		try:
+			self.selector.unregister(handler)
+		except (KeyError, ValueError):
+			pass
+		try:
+			handler.request_close()
+		except:
+			self.handler_error(request, handler.client_address)
+		finally:
+			self.request_shutdown(request)
+		return
+
 	def server_start(self):
 		return self.call_in_thread(target=self.server_loop, args=(), kwargs={}, daemon=self.daemon_threads)
 
@@ -170,10 +376,14 @@ class TCPStreamServer(ThreadCaller):
 		return
 
 	def request_process(self, request, client_address):
+		if self.server_mode == 'reactor':
+			return self.reactor_attach(request, client_address)
 		return self.call_in_thread(target=self.request_thread, args=(request, client_address), kwargs={}, daemon=self.daemon_threads)
 
 	def request_handle(self, request, client_address):
-		return self.handler_class(request, client_address, self)
+		handler = self.handler_class(request, client_address, self)
+		handler.request_run()
+		return handler
 
 	def request_error(self, request, client_address):
 		sys.stderr.write('-' * 40 + '\n')
@@ -200,15 +410,38 @@ class TCPStreamHandler(object):
 		self.socket = socket
 		self.client_address = client_address
 		self.server = server
+		return
+
+	def fileno(self):
+		return self.socket.fileno() if self.socket else None
+
+	def request_run(self):
+		self.request_open()
+		self.request_serve()
+		self.request_close()
+		return
+
+	def request_open(self):
 		self.request_init()
 		self.request_intro()
-		self.request_serve()
+		return
+
+	def request_close(self):
 		self.request_outro()
 		self.request_fini()
 		return
 
-	def fileno(self):
-		return self.socket.fileno() if self.socket else None
+	def request_readable(self):
+		return False
+
+	def request_writable(self):
+		return True
+
+	def request_pending(self):
+		return False
+
+	def request_deadline(self):
+		return 0.0 if self.request_pending() else None
 
 	def request_init(self):
 		if self.disable_nagle_algorithm:
@@ -300,14 +533,27 @@ class TCPStreamClient(object):
 		return
 
 class TCPStreamIO(object):
+	send_queued = False
+	send_queue_limit = 0
+	send_queue_policy = 'drop_oldest'
+	send_coalesce_delay = 0.0
+	send_coalesce_size = 0
+
 	def __init__(self, *args, **kwargs):
 		super(TCPStreamIO, self).__init__()
 		self.rfile = None
 		self.wfile = None
 		return
 
-	def stream_files_create(self):
-		self.rfile = self.wfile = SocketFileIO(self.socket)
+	def stream_files_create(self, notify=None):
+		self.rfile = SocketFileIO(self.socket)
+		if self.send_queued or notify is not None:
+			self.wfile = SocketQueueIO(self.socket, notify, self.send_queue_limit, self.send_queue_policy, self.send_encode, self.send_prepare)
+			self.wfile.coalesce(self.send_coalesce_delay, self.send_coalesce_size)
+			if notify is None:
+				self.wfile.send_start()
+		else:
+			self.wfile = self.rfile
 		return
 
 	def stream_files_remove(self):
@@ -323,30 +569,82 @@ class TCPStreamIO(object):
 		self.wfile = None
 		return
 
+	def send_prepare(self):
+		return
+
+	def send_encode(self, items):
+		return items
+
 class TCPFrameIO(object):
 	frame_length_frmt = '=I'
 	frame_length_size = struct.calcsize(frame_length_frmt)
+	frame_recv_size = 65536
+	frame_buffer_size = 65536
+	frame_buffer_keep = 1048576
+
+	def __init__(self, *args, **kwargs):
+		super(TCPFrameIO, self).__init__()
+		self.frame_header = bytearray(self.frame_length_size)
+		self.frame_buffer = bytearray(self.frame_buffer_size)
+		return
+
+	def recv_exactly(self, target):
+		target = memoryview(target)
+		received = 0
+		while received < len(target):
+			count = self.rfile.readinto(target[received:])
+			if not count:
+				return False
+			received += count
+		return True
+
+	def frame_encode(self, binary_data):
+		return [struct.pack(self.frame_length_frmt, len(binary_data)), binary_data]
 
 	def send_frame(self, binary_data):
 		try:
 			if not binary_data:
 				raise IOError('Sending empty frames is prohibited.')
-			self.wfile.write(struct.pack(self.frame_length_frmt, len(binary_data)))
-			self.wfile.write(binary_data)
+			self.wfile.writev(self.frame_encode(binary_data))
 		except (socket.error, IOError):
 			return False
 		return True
 
 	def recv_frame(self):
 		try:
-			binary_data = self.rfile.read(self.frame_length_size)
-			if not binary_data or len(binary_data) != self.frame_length_size:
+			if not self.recv_exactly(self.frame_header):
+				return None
+			length = struct.unpack_from(self.frame_length_frmt, self.frame_header)[0]
+			if not length:
 				return None
-			length = struct.unpack(self.frame_length_frmt, binary_data)[0]
-			binary_data = self.rfile.read(length)
-			if not binary_data or len(binary_data) != length:
+			frame_buffer = self.frame_buffer
+			if length > len(frame_buffer):
+				frame_buffer = bytearray(length)
+				if length <= self.frame_buffer_keep:
+					self.frame_buffer = frame_buffer
+			if not self.recv_exactly(memoryview(frame_buffer)[:length]):
 				return None
-			return binary_data
+			return frame_view(frame_buffer, length)
 		except (socket.error, IOError):
 			return None
 		return
+
+	def recv_frames_nowait(self):
+		frames = list()
+		rfile = self.rfile
+		try:
+			if not rfile.recv_buffer_fill(self.frame_recv_size):
+				return frames, False
+		except (socket.error, IOError) as error:
+			if error.args and error.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return frames, True
+			return frames, False
+		while rfile.recv_buffer_size() >= self.frame_length_size:
+			length = struct.unpack(self.frame_length_frmt, rfile.recv_buffer_peek(self.frame_length_size).tobytes())[0]
+			if not length:
+				return frames, False
+			if rfile.recv_buffer_size() - self.frame_length_size < length:
+				break
+			rfile.recv_buffer_skip(self.frame_length_size)
+			frames.append(rfile.recv_buffer_take(length))
+		return frames, True
@@ -1,18 +1,32 @@
 # *************************
 # Python
 # *************************
-import io
+import time
 import errno
 import socket
+import itertools
+import threading
+import collections
 
 # *************************
 # Package
 # *************************
 # Nothing
 
+clock = getattr(time, 'monotonic', time.time)
+
+def join_buffers(buffers):
+	result = bytearray(sum(map(len, buffers)))
+	offset = 0
+	for data in buffers:
+		result[offset:offset + len(data)] = data
+		offset += len(data)
+	return result
+
 class SocketFileIO(object):
 	recv_chunk_size = 8192
 	send_chunk_size = 8192
+	send_vector_size = 512
 
 	@staticmethod
 	def eintr_retry_call(func, *args, **kwargs):
@@ -26,7 +40,9 @@ class SocketFileIO(object):
 
 	def __init__(self, socket):
 		self._socket = socket
-		self._recv_buffer = io.BytesIO()
+		self._recv_buffer = bytearray(self.recv_chunk_size)
+		self._recv_start = 0
+		self._recv_end = 0
 		return
 
 	def close(self):
@@ -92,98 +108,126 @@ class SocketFileIO(object):
 				break
 		return lines
 
-	def read(self, size=-1):
+	def recv_buffer_reserve(self, size):
 		rbuffer = self._recv_buffer
-		self._recv_buffer = io.BytesIO()
+		if self._recv_start == self._recv_end:
+			self._recv_start = self._recv_end = 0
+		if len(rbuffer) - self._recv_end >= size:
+			return
+		rbuffer_len = self._recv_end - self._recv_start
+		if self._recv_start and len(rbuffer) - rbuffer_len >= size:
+			rbuffer[:rbuffer_len] = rbuffer[self._recv_start:self._recv_end]
+		else:
+			rbuffer = bytearray(max(rbuffer_len + size, len(rbuffer) * 2))
+			rbuffer[:rbuffer_len] = memoryview(self._recv_buffer)[self._recv_start:self._recv_end]
+			self._recv_buffer = rbuffer
+		self._recv_start, self._recv_end = 0, rbuffer_len
+		return
+
+	def recv_buffer_fill(self, size=None):
+		size = size if size is not None else self.recv_chunk_size
+		self.recv_buffer_reserve(size)
+		received = self.eintr_retry_call(self._socket.recv_into, memoryview(self._recv_buffer)[self._recv_end:self._recv_end + size], size)
+		self._recv_end += received
+		return received
+
+	def recv_buffer_size(self):
+		return self._recv_end - self._recv_start
+
+	def recv_buffer_peek(self, size=-1):
+		end = self._recv_end if size < 0 else min(self._recv_start + size, self._recv_end)
+		return memoryview(self._recv_buffer)[self._recv_start:end]
+
+	def recv_buffer_skip(self, size):
+		self._recv_start = min(self._recv_start + size, self._recv_end)
+		return
+
+	def recv_buffer_take(self, size):
+		data = self.recv_buffer_peek(size).tobytes()
+		self.recv_buffer_skip(len(data))
+		return data
+
+	def read(self, size=-1):
 		if size < 0:
-			while True:
-				data = self.eintr_retry_call(self._socket.recv, self.recv_chunk_size)
-				if not data:
-					break
-				rbuffer.write(data)
-			return rbuffer.getvalue()
-		rbuffer_len = rbuffer.tell()
-		if rbuffer_len >= size:
-			rbuffer.seek(0)
-			data = rbuffer.read(size)
-			self._recv_buffer.write(rbuffer.read())
-			return data
-		data = self.eintr_retry_call(self._socket.recv, size - rbuffer_len)
-		if not rbuffer_len:
-			return data
-		rbuffer.write(data)
-		return rbuffer.getvalue()
+			while self.recv_buffer_fill():
+				pass
+			return self.recv_buffer_take(-1)
+		rbuffer_len = self.recv_buffer_size()
+		if rbuffer_len < size:
+			self.recv_buffer_fill(size - rbuffer_len)
+		return self.recv_buffer_take(size)
 
 	def readinto(self, b):
-		rbuffer = self._recv_buffer
-		self._recv_buffer = io.BytesIO()
-		rbuffer_len = rbuffer.tell()
-		size = len(b)
-		if rbuffer_len >= size:
-			rbuffer.seek(0)
-			b[0:size] = rbuffer.read(size)
-			self._recv_buffer.write(rbuffer.read())
-			return size
-		data = self.eintr_retry_call(self._socket.recv, size - rbuffer_len)
-		size = min(size, len(data) + rbuffer_len)
+		target = memoryview(b)
+		size = len(target)
+		rbuffer_len = self.recv_buffer_size()
 		if not rbuffer_len:
-			b[0:size] = data
-			return size
-		rbuffer.write(data)
-		b[0:size] = rbuffer.getvalue()
-		return size
+			return self.eintr_retry_call(self._socket.recv_into, target, size)
+		if rbuffer_len < size:
+			self.recv_buffer_fill(size - rbuffer_len)
+		data = self.recv_buffer_peek(size)
+		target[:len(data)] = data
+		self.recv_buffer_skip(len(data))
+		return len(data)
 
 	def readline(self, size=-1):
-		rbuffer = self._recv_buffer
-		self._recv_buffer = io.BytesIO()
-		rbuffer_len = rbuffer.tell()
-		if rbuffer_len > 0:
-			rbuffer.seek(0)
-			line = rbuffer.readline(size)
-			if line.endswith(b'\n') and len(line) == size:
-				self._recv_buffer.write(rbuffer.read())
-				return line
-			rbuffer.seek(0, 2)
-		if size < 0:
-			while True:
-				data = self.eintr_retry_call(self._socket.recv, self.recv_chunk_size)
-				if not data:
-					break
-				new_line = data.find(b'\n')
-				if new_line >= 0:
-					new_line += 1
-					self._recv_buffer.write(data[new_line:])
-					if not rbuffer_len:
-						return data[:new_line]
-					rbuffer.write(data[:new_line])
-					break
-				rbuffer.write(data)
-				rbuffer_len += len(data)
-			return rbuffer.getvalue()
-		left = size - rbuffer_len
-		data = self.eintr_retry_call(self._socket.recv, left)
-		new_line = data.find(b'\n', 0, left)
-		if new_line >= 0:
-			new_line += 1
-			self._recv_buffer.write(data[new_line:])
-			if not rbuffer_len:
-				return data[:new_line]
-			rbuffer.write(data[:new_line])
-		if not rbuffer_len:
-			return data
-		rbuffer.write(data)
-		return rbuffer.getvalue()
+		scanned = self._recv_start
+		while True:
+			limit = self._recv_end if size < 0 else min(self._recv_start + size, self._recv_end)
+			new_line = self._recv_buffer.find(b'\n', scanned, limit)
+			if new_line >= 0:
+				return self.recv_buffer_take(new_line + 1 - self._recv_start)
+			if size >= 0 and self.recv_buffer_size() >= size:
+				return self.recv_buffer_take(size)
+			scanned = limit - self._recv_start
+			if not self.recv_buffer_fill(self.recv_chunk_size if size < 0 else size - self.recv_buffer_size()):
+				return self.recv_buffer_take(-1)
+			scanned += self._recv_start
+		return
 
 	def write(self, data):
-		data_len = len(data)
-		wbuffer = io.BytesIO(data)
-		wbuffer.seek(0)
-		while wbuffer.tell() < data_len:
-			self._socket.sendall(wbuffer.read(self.send_chunk_size))
-		return data_len
+		self._socket.sendall(data)
+		return len(data)
+
+	def writev(self, buffers):
+		return self.send_buffers(buffers)
 
 	def writelines(self, lines):
-		return self.write(b''.join(lines))
+		return self.writev(list(lines))
+
+	def send_views(self, views):
+		if hasattr(self._socket, 'sendmsg'):
+			return self.eintr_retry_call(self._socket.sendmsg, views[:self.send_vector_size])
+		# Small views are joined up to one chunk, a large view is sent on its own without a copy.
+		count, total = 1, len(views[0])
+		while count < len(views) and total + len(views[count]) <= self.send_chunk_size:
+			total += len(views[count])
+			count += 1
+		if count > 1:
+			views[:count] = [memoryview(join_buffers(views[:count]))]
+		return self.eintr_retry_call(self._socket.send, views[0])
+
+	@staticmethod
+	def consume_views(views, sent):
+		while views and sent >= len(views[0]):
+			sent -= len(views.pop(0))
+		if sent:
+			views[0] = views[0][sent:]
+		return views
+
+	def send_buffers(self, buffers):
+		buffers = [data for data in buffers if len(data)]
+		total = sum(map(len, buffers))
+		if hasattr(self._socket, 'sendmsg'):
+			views = [memoryview(data) for data in buffers]
+			while views:
+				self.consume_views(views, self.send_views(views))
+		elif len(buffers) > 1 and total <= self.send_chunk_size:
+			self._socket.sendall(join_buffers(buffers))
+		else:
+			for data in buffers:
+				self._socket.sendall(data)
+		return total
 
 	def __del__(self):
 		try:
@@ -191,3 +235,217 @@ class SocketFileIO(object):
 		except:
 			pass
 		return
+
+class SocketQueueIO(SocketFileIO):
+	overflow_policies = ('drop_oldest', 'drop_newest', 'disconnect')
+	dequeue_size = 262144
+
+	def __init__(self, socket, notify=None, limit=0, policy='drop_oldest', encoder=None, prepare=None):
+		super(SocketQueueIO, self).__init__(socket)
+		if policy not in self.overflow_policies:
+			raise ValueError('Unknown overflow policy {0!r}.'.format(policy))
+		self._send_lock = threading.Lock()
+		self._send_ready = threading.Condition(self._send_lock)
+		# Droppable items (log records) count against limit, control items are never dropped.
+		self._send_queue = collections.deque()
+		self._send_control = collections.deque()
+		self._send_counter = itertools.count()
+		self._send_current = list()
+		self._send_notify = notify
+		self._send_encoder = encoder
+		self._send_prepare = prepare
+		self._send_closed = False
+		self._send_since = None
+		self._send_flush = False
+		self.limit = limit
+		self.policy = policy
+		self.coalesce_delay = 0.0
+		self.coalesce_size = 0
+		self.overflowed = False
+		self.queued_bytes = 0
+		self.sent_bytes = 0
+		self.dropped_bytes = 0
+		return
+
+	def close(self):
+		self._send_lock.acquire()
+		self._send_closed = True
+		self._send_queue.clear()
+		self._send_control.clear()
+		self.queued_bytes = 0
+		self._send_ready.notify_all()
+		self._send_lock.release()
+		return super(SocketQueueIO, self).close()
+
+	def coalesce(self, delay=None, size=None):
+		self._send_lock.acquire()
+		if delay is not None:
+			self.coalesce_delay = delay
+		if size is not None:
+			self.coalesce_size = size
+		self._send_ready.notify_all()
+		self._send_lock.release()
+		if self._send_notify is not None:
+			self._send_notify()
+		return
+
+	def flush(self):
+		self._send_lock.acquire()
+		ready = self.send_deadline() == 0.0
+		self._send_flush = self.queued()
+		if self._send_flush and not ready:
+			self._send_ready.notify_all()
+		self._send_lock.release()
+		if self._send_flush and not ready and self._send_notify is not None:
+			self._send_notify()
+		return
+
+	def queued(self):
+		return bool(self._send_queue or self._send_control)
+
+	def send_deadline(self):
+		if not self.queued():
+			return None
+		if self._send_flush or self.coalesce_delay <= 0 or (self.coalesce_size and self.queued_bytes >= self.coalesce_size):
+			return 0.0
+		return max(self._send_since + self.coalesce_delay - clock(), 0.0)
+
+	def deadline(self):
+		if self.overflowed or self._send_current:
+			return 0.0
+		return self.send_deadline()
+
+	def pending(self):
+		return self.deadline() == 0.0
+
+	def write(self, data):
+		return self.enqueue(memoryview(data).tobytes(), len(data), False)
+
+	def writev(self, buffers):
+		data = join_buffers(buffers)
+		return self.enqueue(data, len(data), False)
+
+	def enqueue(self, item, size, droppable=True):
+		if not size:
+			return 0
+		notify = False
+		self._send_lock.acquire()
+		try:
+			if self.overflowed or self._send_closed:
+				self.dropped_bytes += size
+				return size
+			if droppable and self.limit and self.queued_bytes + size > self.limit:
+				if self.policy == 'drop_newest' or (self.policy == 'drop_oldest' and size > self.limit):
+					self.dropped_bytes += size
+					return size
+				elif self.policy == 'drop_oldest':
+					while self.queued_bytes + size > self.limit:
+						self.queued_bytes -= self._send_queue[0][2]
+						self.dropped_bytes += self._send_queue.popleft()[2]
+				else:
+					self.overflowed = True
+					self.dropped_bytes += self.queued_bytes + size
+					self._send_queue.clear()
+					self._send_control.clear()
+					self.queued_bytes = 0
+					self._send_ready.notify_all()
+					notify = True
+					try:
+						self._socket.shutdown(socket.SHUT_RDWR)
+					except (socket.error, AttributeError):
+						pass
+					return size
+			ready = self.send_deadline() == 0.0
+			if not self.queued():
+				self._send_since = clock()
+			if droppable:
+				self._send_queue.append((next(self._send_counter), item, size))
+				self.queued_bytes += size
+			else:
+				self._send_control.append((next(self._send_counter), item, size))
+			if not ready and (len(self._send_queue) + len(self._send_control) == 1 or self.send_deadline() == 0.0):
+				self._send_ready.notify_all()
+				notify = True
+		finally:
+			self._send_lock.release()
+			if notify and self._send_notify is not None:
+				self._send_notify()
+		return size
+
+	def dequeue(self):
+		if self._send_prepare is not None:
+			self._send_prepare()
+		items = list()
+		size = 0
+		limit = self.coalesce_size or self.dequeue_size
+		queue, control = self._send_queue, self._send_control
+		# Only about one batch is taken under the lock, encoding runs after it is released.
+		self._send_lock.acquire()
+		try:
+			while (queue or control) and size < limit:
+				# Both queues are ordered by counter, taking the lower head keeps the order items were enqueued in.
+				if control and (not queue or control[0][0] < queue[0][0]):
+					counter, item, item_size = control.popleft()
+				else:
+					counter, item, item_size = queue.popleft()
+					self.queued_bytes -= item_size
+				items.append(item)
+				size += item_size
+			self._send_flush = self._send_flush and self.queued()
+		finally:
+			self._send_lock.release()
+		return self._send_encoder(items) if self._send_encoder is not None else items
+
+	def send_ready(self):
+		self._send_lock.acquire()
+		ready = self.send_deadline() == 0.0
+		self._send_lock.release()
+		return ready
+
+	def send_pending(self):
+		# Only the reactor thread sends and touches the current buffers.
+		while self._send_current or self.send_ready():
+			if not self._send_current:
+				self._send_current = [memoryview(data) for data in self.dequeue() if len(data)]
+				continue
+			try:
+				sent = self.send_views(self._send_current)
+			except socket.error as error:
+				if error.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+					raise
+				break
+			self.sent_bytes += sent
+			if self.consume_views(self._send_current, sent):
+				break
+		return self.pending()
+
+	def send_loop(self):
+		while True:
+			self._send_lock.acquire()
+			try:
+				while not self._send_closed and not self.overflowed:
+					delay = self.send_deadline()
+					if delay == 0.0:
+						break
+					self._send_ready.wait(delay)
+				if self._send_closed or self.overflowed:
+					break
+			finally:
+				self._send_lock.release()
+			try:
+				self.sent_bytes += self.send_buffers(self.dequeue())
+			except (socket.error, AttributeError):
+				self.overflowed = True
+				break
+		if self.overflowed and not self._send_closed:
+			try:
+				self._socket.shutdown(socket.SHUT_RDWR)
+			except (socket.error, AttributeError):
+				pass
+		return
+
+	def send_start(self):
+		thread = threading.Thread(target=self.send_loop)
+		thread.daemon = True
+		thread.start()
+		return thread
@@ -1,33 +1,50 @@
 # *************************
 # Python
 # *************************
-import io
 import uuid
 
 # *************************
 # Package
 # *************************
+from .logs import LogHistory
 from .helpers import Event
 from .client import TerminalClient
 
 class LogWriter(object):
-	def __init__(self, write_func):
+	def __init__(self, write_func, profile_func, samples_func, stats_func):
 		super(LogWriter, self).__init__()
 		self.write_func = write_func
+		self.profile_func = profile_func
+		self.samples_func = samples_func
+		self.stats_func = stats_func
 		return
 
 	def write(self, string):
 		return self.write_func(string)
 
+	def profile(self, result):
+		return self.profile_func(result)
+
+	def samples(self, string):
+		return self.samples_func(string)
+
+	def stats(self, string):
+		return self.stats_func(string)
+
 class ScriptTerminal(object):
 	uuid = str(uuid.uuid4())
+	script_hashing = True
+	log_cursor = None
 
 	def __init__(self):
 		super(ScriptTerminal, self).__init__()
 		self.client = None
 		self.log_thread = None
 		self.log_event = Event()
-		self.log_buffer = io.StringIO()
+		self.profile_event = Event()
+		self.samples_event = Event()
+		self.stats_event = Event()
+		self.log_buffer = LogHistory()
 		return
 
 	def register_event(self, delegate):
@@ -45,14 +62,18 @@ class ScriptTerminal(object):
 		return self.unregister_event(self.log_buffer_write)
 
 	def connect(self, server_address):
+		self.log_cursor = self.log_cursor_get()
 		self.client = TerminalClient(server_address)
+		self.client.script_hashing = self.script_hashing
+		self.client.log_cursor = self.log_cursor
 		result = self.client.connect()
 		if result and not self.log_is_active():
-			self.log_thread = self.client.print_start(LogWriter(self.log_event))
+			self.log_thread = self.client.print_start(LogWriter(self.log_event, self.profile_event, self.samples_event, self.stats_event))
 		return result
 
 	def disconnect(self):
 		self.client.disconnect()
+		self.log_cursor = self.client.log_cursor
 		self.client = None
 		return
 
@@ -62,21 +83,61 @@ class ScriptTerminal(object):
 	def log_buffer_write(self, string):
 		return self.log_buffer.write(string)
 
+	def log_cursor_get(self):
+		return self.client.log_cursor if self.client is not None else self.log_cursor
+
 	def log_is_active(self):
 		return self.log_thread is not None and self.log_thread.is_alive()
 
 	def buffered_logs_get(self):
-		return self.log_buffer.getvalue()
+		return self.log_buffer.recent()[1]
+
+	def buffered_logs_recent(self):
+		return self.log_buffer.recent()
+
+	def buffered_logs_older(self, offset, size):
+		return self.log_buffer.older(offset, size)
 
 	def buffered_logs_clear(self):
-		self.log_buffer = io.StringIO()
+		self.log_buffer.clear()
+		return
+
+	def buffered_logs_close(self):
+		self.log_buffer.close()
 		return
 
 	def send_script(self, filename, script):
 		return self.client.send_script(filename, script)
 
-	def fetch_logs(self):
-		return self.client.fetch_logs()
+	def profile_script(self, filename, script, top=25, raw=False):
+		return self.client.profile_script(filename, script, top, raw)
+
+	def sampling_start(self, interval=0.005):
+		return self.client.sampling_start(interval)
+
+	def sampling_stop(self):
+		return self.client.sampling_stop()
+
+	def sampling_clear(self):
+		return self.client.sampling_clear()
+
+	def sampling_fetch(self, chunk_size=262144):
+		return self.client.sampling_fetch(chunk_size)
+
+	def stats_report(self):
+		return self.client.stats_report()
+
+	def fetch_logs(self, since=None):
+		return self.client.fetch_logs(since)
+
+	def log_coalescing(self, delay=None, size=None):
+		return self.client.log_coalescing(delay, size)
+
+	def log_subscribe(self, streams=None, levels=None, pattern=None, prefixes=None):
+		return self.client.log_subscribe(streams, levels, pattern, prefixes)
+
+	def log_compression(self, level=6):
+		return self.client.log_compression(level)
 
 	def save_locals(self):
 		return self.client.update_locals(self.uuid)
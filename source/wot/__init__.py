@@ -1,7 +1,7 @@
 # *************************
 # Python
 # *************************
-import functools
+# Nothing
 
 # *************************
 # BigWorld
@@ -27,26 +27,20 @@ from .terminal.server import TerminalHandler, TerminalController
 # *************************
 # Globals
 # *************************
-host, port = 'localhost', 9999
-controller = TerminalController((host, port), TerminalHandler)
+host, port, mode = 'localhost', 9999, 'threaded'
+controller = TerminalController((host, port), TerminalHandler, server_mode=mode, tick_hook=BigWorld.callback)
 
 # *************************
 # BigWorld log hooks
 # *************************
-def bwLogHook(origin, prefix, msg, *args, **kwargs):
-	global controller
-	if controller is not None:
-		controller.server.errtee.write('[{0}] {1}\n'.format(prefix, msg), skipTarget = True)
-	return origin(prefix, msg, *args, **kwargs)
-
-BigWorld.logTrace = functools.partial(bwLogHook, BigWorld.logTrace)
-BigWorld.logDebug = functools.partial(bwLogHook, BigWorld.logDebug)
-BigWorld.logInfo = functools.partial(bwLogHook, BigWorld.logInfo)
-BigWorld.logNotice = functools.partial(bwLogHook, BigWorld.logNotice)
-BigWorld.logWarning = functools.partial(bwLogHook, BigWorld.logWarning)
-BigWorld.logError = functools.partial(bwLogHook, BigWorld.logError)
-BigWorld.logCritical = functools.partial(bwLogHook, BigWorld.logCritical)
-BigWorld.logHack = functools.partial(bwLogHook, BigWorld.logHack)
+BigWorld.logTrace = controller.server.log_hook('TRACE', BigWorld.logTrace)
+BigWorld.logDebug = controller.server.log_hook('DEBUG', BigWorld.logDebug)
+BigWorld.logInfo = controller.server.log_hook('INFO', BigWorld.logInfo)
+BigWorld.logNotice = controller.server.log_hook('NOTICE', BigWorld.logNotice)
+BigWorld.logWarning = controller.server.log_hook('WARNING', BigWorld.logWarning)
+BigWorld.logError = controller.server.log_hook('ERROR', BigWorld.logError)
+BigWorld.logCritical = controller.server.log_hook('CRITICAL', BigWorld.logCritical)
+BigWorld.logHack = controller.server.log_hook('HACK', BigWorld.logHack)
 
 debug_utils._g_logMapping.update({
 	'TRACE': BigWorld.logTrace,
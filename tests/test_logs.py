@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'source'))
+
+from terminal.logs import LogRingBuffer
+
+def bwlog(message):
+	return (2, (u'P', message), 'DEBUG')
+
+class LogRingBufferSpoolTest(unittest.TestCase):
+	def test_out_of_order_indices(self):
+		buffer = LogRingBuffer(capacity=16)
+		for message in (u'a', u'b', u'c', u'd'):
+			buffer.capture(bwlog(message))
+		entries = list(buffer.spool)
+		buffer.spool.clear()
+		buffer.spool.extend([entries[1], entries[0], entries[3], entries[2]])
+		self.assertEqual(buffer.sequence(), 4)
+		buffer.capture(bwlog(u'e'))
+		evicted, records = buffer.fetch(0)
+		self.assertEqual(evicted, 0)
+		self.assertEqual([record[1][1] for record in records], [u'a', u'b', u'c', u'd', u'e'])
+		self.assertEqual(buffer.sequence(), 5)
+		return
+
+	def test_overflow_is_a_gap(self):
+		buffer = LogRingBuffer(capacity=4)
+		for index in range(10):
+			buffer.capture(bwlog(u'm{0}'.format(index)))
+		evicted, records = buffer.fetch(0)
+		self.assertEqual(evicted, 6)
+		self.assertEqual([record[1][1] for record in records], [u'm6', u'm7', u'm8', u'm9'])
+		self.assertEqual(buffer.sequence(), 10)
+		return
+
+	def test_concurrent_capture(self):
+		buffer = LogRingBuffer(capacity=100000, size_limit=1 << 30)
+		def produce(name):
+			for index in range(5000):
+				buffer.capture(bwlog(u'{0}{1}'.format(name, index)))
+			return
+		threads = [threading.Thread(target=produce, args=(name, )) for name in u'abcd']
+		for thread in threads:
+			thread.start()
+		sequences = list()
+		while any(thread.is_alive() for thread in threads):
+			sequences.append(buffer.sequence())
+		for thread in threads:
+			thread.join()
+		sequences.append(buffer.sequence())
+		self.assertEqual(sequences, sorted(sequences))
+		evicted, records = buffer.fetch(0)
+		self.assertEqual((evicted, len(records)), (0, 20000))
+		return
+
+if __name__ == '__main__':
+	unittest.main()